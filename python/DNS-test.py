@@ -1,31 +1,76 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
-import tkinter as tk
-from tkinter import ttk, scrolledtext, messagebox, filedialog
+try:
+    import tkinter as tk
+    from tkinter import ttk, scrolledtext, messagebox, filedialog
+except ImportError:
+    tk = None
+try:
+    import numpy as np
+except ImportError:
+    np = None
 import threading
 import time
 import os
 import sys
 import socket
+import errno
 import struct
+import random
+import selectors
+import heapq
+import itertools
+import ssl
+import statistics
+import json
+import argparse
+from array import array
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
 import pyperclip
 
 
 class DNSOptimalTester:
-    def __init__(self, root):
+    def __init__(self, root=None, output=None):
         self.root = root
-        self.root.title("DNS 最优检测工具")
-        self.root.geometry("920x640")
+        self.output = output or sys.stdout
 
         self.timeout = 1.5
+        self.timeout_floor = 0.3
+        self.timeout_factor = 4
+        self.max_inflight = 128
+        self.sockets_per_server = 2
+        self._udp_pool = {}
+        self._udp_pool_lock = threading.Lock()
+        self._tid_history = {}
+        self.rounds = 5
+        self.warmup_rounds = 1
+        self.cold_cache = True
+        self.connect_test = True
+        self.connect_port = 443
+        self.connect_rounds = 3
+        self.query_aaaa = True
+        self.he_delay = 0.25
+        self.stream_transports = ['tcp', 'dot']
+        self.udp_port = 53
+        self.tcp_port = 53
+        self.dot_port = 853
+        self.dot_verify = False
+        self.forward_port = 5300
+        self.bulk_domains = []
+        self.matrix = None
+        self.matrix_rounds = 1
+        self.matrix_inflight = 256
+        self.forward_top_n = 3
+        self.forwarder = None
+        self.tested_servers = []
         self.is_testing = False
         self.results = []
 
         self.app_dir = self._get_app_dir()
         self.default_file = os.path.join(self.app_dir, "dns.txt")
         self.archive_dir = os.path.join(os.path.expanduser("~"), "Desktop", "DNS最优检测_保留")
-        os.makedirs(self.archive_dir, exist_ok=True)
 
         self.test_domains = [
             "github.com",
@@ -47,8 +92,12 @@ class DNSOptimalTester:
             "9.9.9.9",
         ]
 
-        self.create_widgets()
-        self.load_default_servers()
+        if self.root is not None:
+            os.makedirs(self.archive_dir, exist_ok=True)
+            self.root.title("DNS 最优检测工具")
+            self.root.geometry("1200x660")
+            self.create_widgets()
+            self.load_default_servers()
 
     def create_widgets(self):
         main = ttk.Frame(self.root, padding="10")
@@ -64,6 +113,7 @@ class DNSOptimalTester:
         file_menu = tk.Menu(menubar, tearoff=0)
         file_menu.add_command(label="📥 加载默认", command=self.load_default_servers)
         file_menu.add_command(label="📁 导入文件", command=self.select_file)
+        file_menu.add_command(label="📄 导入域名列表", command=self.select_domain_file)
         file_menu.add_command(label="🗑️ 清空输入", command=self.clear_inputs)
         file_menu.add_separator()
         file_menu.add_command(label="退出", command=self.root.quit)
@@ -100,16 +150,23 @@ class DNSOptimalTester:
         self.status_label.grid(row=5, column=0, columnspan=2, sticky=tk.W)
 
         ttk.Label(main, text="检测结果：", font=("Arial", 10, "bold")).grid(row=6, column=0, sticky=tk.W)
-        columns = ("DNS服务器", "平均时延", "成功率", "最快域", "最慢域")
+        columns = ("DNS服务器", "中位时延", "P95", "抖动", "丢包率", "冷缓存中位", "解析+连接", "IPv6优先", "TCP", "DoT", "最快域", "最慢域")
         self.tree = ttk.Treeview(main, columns=columns, show="headings", height=12)
         self.tree.grid(row=7, column=0, columnspan=2, sticky=(tk.W, tk.E, tk.N, tk.S))
         for col in columns:
             self.tree.heading(col, text=col)
         self.tree.column("DNS服务器", width=140)
-        self.tree.column("平均时延", width=100, anchor=tk.CENTER)
-        self.tree.column("成功率", width=80, anchor=tk.CENTER)
-        self.tree.column("最快域", width=220)
-        self.tree.column("最慢域", width=220)
+        self.tree.column("中位时延", width=80, anchor=tk.CENTER)
+        self.tree.column("P95", width=80, anchor=tk.CENTER)
+        self.tree.column("抖动", width=70, anchor=tk.CENTER)
+        self.tree.column("丢包率", width=60, anchor=tk.CENTER)
+        self.tree.column("冷缓存中位", width=90, anchor=tk.CENTER)
+        self.tree.column("解析+连接", width=90, anchor=tk.CENTER)
+        self.tree.column("IPv6优先", width=90, anchor=tk.CENTER)
+        self.tree.column("TCP", width=120, anchor=tk.CENTER)
+        self.tree.column("DoT", width=120, anchor=tk.CENTER)
+        self.tree.column("最快域", width=160)
+        self.tree.column("最慢域", width=160)
         scroll = ttk.Scrollbar(main, orient=tk.VERTICAL, command=self.tree.yview)
         scroll.grid(row=7, column=2, sticky=(tk.N, tk.S))
         self.tree.configure(yscrollcommand=scroll.set)
@@ -120,6 +177,8 @@ class DNSOptimalTester:
         self.copy_best_btn.pack(side=tk.LEFT, padx=(0, 5))
         self.copy_ps_btn = ttk.Button(bottom, text="📋 复制PowerShell设置命令", command=self.copy_ps_commands, state=tk.DISABLED)
         self.copy_ps_btn.pack(side=tk.LEFT, padx=(0, 5))
+        self.forward_btn = ttk.Button(bottom, text="🛰️ 启动本地转发", command=self.toggle_forwarder, state=tk.DISABLED)
+        self.forward_btn.pack(side=tk.LEFT, padx=(0, 5))
         self.open_dir_btn = ttk.Button(bottom, text="📂 打开保留目录", command=self.open_archive_dir)
         self.open_dir_btn.pack(side=tk.RIGHT)
 
@@ -131,9 +190,16 @@ class DNSOptimalTester:
     def _usage_text(self):
         return (
             "使用说明：\n"
-            "1) 工具针对 Docker/Git 常用域进行DNS解析时延与成功率检测。\n"
-            "2) 检测完成后，可复制推荐DNS或PowerShell命令（需管理员）。\n"
-            "3) 推荐：优先使用国内公共DNS（114/223），网络不佳时尝试 1.1.1.1/8.8.8.8。\n"
+            "1) 工具针对 Docker/Git 常用域多轮解析（首轮预热不计），按中位时延/P95/抖动/丢包率排序。\n"
+            "2) 冷缓存列为随机子域名查询（强制递归解析）的中位时延，反映首次拉取新仓库时的真实解析耗时。\n"
+            "3) 解析+连接：对解析出的首个地址测 TCP 443 建连时延，与解析时延相加后作为排序依据（CDN 就近程度直接影响拉取速度）。\n"
+            "   IPv6优先：同时解析 AAAA 并分别测 v4/v6 建连，按 Happy Eyeballs（v6 先行、250ms 后补发 v4）估算 v6 优先相对纯 v4 的快慢。\n"
+            "   支持 IPv6 DNS（如 2400:3200::1），直接按行填写即可。\n"
+            "4) TCP/DoT 列：同一连接上流水线发送查询的复用中位时延（括号内为建连/TLS握手开销），用于判断切换传输方式是否划算。\n"
+            "5) 检测完成后，可复制推荐DNS或PowerShell命令（需管理员）。\n"
+            "   或启动本地转发（127.0.0.1:5300），查询同时发往排名前3的DNS取最快应答，并按TTL缓存。\n"
+            "6) 批量模式：文件 → 导入域名列表（每行一个域名或URL），按 服务器×域名 矩阵检测，完整矩阵另存为 CSV。\n"
+            "7) 推荐：优先使用国内公共DNS（114/223），网络不佳时尝试 1.1.1.1/8.8.8.8。\n"
         )
 
     def _get_app_dir(self):
@@ -144,7 +210,7 @@ class DNSOptimalTester:
         except Exception:
             return os.getcwd()
 
-    def load_default_servers(self):
+    def _default_server_text(self):
         content = "\n".join(self.default_servers)
         try:
             if os.path.exists(self.default_file):
@@ -154,6 +220,32 @@ class DNSOptimalTester:
                         content = data
         except Exception:
             pass
+        return content
+
+    def _parse_servers(self, content):
+        # IPv6 地址允许写成 [2400:3200::1] 形式，并统一为标准压缩写法以便与应答来源比对
+        servers = []
+        for line in content.split('\n'):
+            server = line.strip()
+            if not server or server.startswith('#'):
+                continue
+            servers.append(self._canonical(server.strip('[]')))
+        return servers
+
+    def _canonical(self, address):
+        # IPv6 地址统一为内核返回的标准压缩写法，无法解析时原样返回
+        if ':' in address:
+            try:
+                return socket.inet_ntop(socket.AF_INET6, socket.inet_pton(socket.AF_INET6, address))
+            except OSError:
+                pass
+        return address
+
+    def _family(self, address):
+        return socket.AF_INET6 if ':' in address else socket.AF_INET
+
+    def load_default_servers(self):
+        content = self._default_server_text()
         self.input_text.delete('1.0', tk.END)
         self.input_text.insert('1.0', content)
         self.status_label.config(text="✅ 已加载候选DNS")
@@ -173,7 +265,43 @@ class DNSOptimalTester:
             except Exception as e:
                 messagebox.showerror("错误", f"无法读取文件: {e}")
 
+    def _parse_domains(self, content):
+        # 兼容代理日志中的 URL / host:port 写法，去重并保持原有顺序
+        domains = []
+        for line in content.split('\n'):
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            host = line.split()[0]
+            if '://' in host:
+                host = host.split('://', 1)[1]
+            host = host.split('/', 1)[0].rsplit('@', 1)[-1]
+            if host.count(':') == 1:
+                host = host.split(':', 1)[0]
+            host = host.strip('.').lower()
+            if host and '.' in host:
+                domains.append(host)
+        return list(dict.fromkeys(domains))
+
+    def _load_domain_file(self, filename):
+        with open(filename, 'r', encoding='utf-8', errors='replace') as f:
+            return self._parse_domains(f.read())
+
+    def select_domain_file(self):
+        filename = filedialog.askopenfilename(
+            title="选择域名列表文件",
+            filetypes=[("文本文件", "*.txt"), ("所有文件", "*.*")],
+            initialdir=self.app_dir
+        )
+        if filename:
+            try:
+                self.bulk_domains = self._load_domain_file(filename)
+                self.status_label.config(text=f"✅ 已加载 {len(self.bulk_domains)} 个域名（批量矩阵模式）")
+            except Exception as e:
+                messagebox.showerror("错误", f"无法读取文件: {e}")
+
     def clear_inputs(self):
+        self.bulk_domains = []
         self.input_text.delete('1.0', tk.END)
         self.tree.delete(*self.tree.get_children())
         self.results = []
@@ -189,7 +317,7 @@ class DNSOptimalTester:
         if not content:
             messagebox.showwarning("警告", "请输入或导入候选DNS")
             return
-        servers = [s.strip() for s in content.split('\n') if s.strip() and not s.strip().startswith('#')]
+        servers = self._parse_servers(content)
         if not servers:
             messagebox.showwarning("警告", "未找到有效的DNS服务器")
             return
@@ -201,97 +329,726 @@ class DNSOptimalTester:
         self.copy_best_btn.config(state=tk.DISABLED)
         self.copy_ps_btn.config(state=tk.DISABLED)
         self.results = []
+        self.tested_servers = servers
         self.tree.delete(*self.tree.get_children())
         self.status_label.config(text=f"开始检测 {len(servers)} 个DNS...")
         t = threading.Thread(target=self._test_worker, args=(servers,))
         t.daemon = True
         t.start()
 
+    def _post(self, fn, *args):
+        if self.root is not None:
+            self.root.after(0, fn, *args)
+        else:
+            fn(*args)
+
+    def _json_value(self, value):
+        # JSON 不支持 inf，失败的时延统一输出为 null
+        if isinstance(value, float) and value == float('inf'):
+            return None
+        if isinstance(value, (list, tuple)):
+            return [self._json_value(v) for v in value]
+        if isinstance(value, dict):
+            return {k: self._json_value(v) for k, v in value.items()}
+        return value
+
+    def _emit(self, record):
+        clean = self._json_value(record)
+        self.output.write(json.dumps(clean, ensure_ascii=False) + "\n")
+        self.output.flush()
+
+    def run_headless(self, servers):
+        self.results = []
+        self.matrix = None
+        self._test_worker(servers)
+        return self._ranked()
+
     def _test_worker(self, servers):
-        total = len(servers)
-        for idx, server in enumerate(servers, 1):
-            self.root.after(0, self.update_progress, (idx / total) * 100, f"检测进度: {idx}/{total}")
-            stats = self._test_server(server)
+        def on_result(stats):
             self.results.append(stats)
-            self.root.after(0, self.update_result, stats)
-        self.root.after(0, self.test_complete)
+            self._post(self.update_result, stats)
+
+        def on_progress(value, text):
+            self._post(self.update_progress, value, text)
+
+        if self.bulk_domains:
+            self._matrix_sweep(servers, self.bulk_domains, on_result, on_progress)
+        else:
+            self.matrix = None
+            self._sweep(servers, on_result, on_progress)
+        self._post(self.test_complete)
+
+    def _sweep(self, servers, on_result=None, on_progress=None):
+        kinds = ('warm', 'cold') if self.cold_cache else ('warm',)
+        total_rounds = self.warmup_rounds + self.rounds
+        per_round = len(servers) * len(self.test_domains) * len(kinds)
+        total = per_round * total_rounds
+        if self.query_aaaa:
+            total += len(servers) * len(self.test_domains)
+        samples = {server: {(domain, kind): [] for domain in self.test_domains for kind in kinds} for server in servers}
+        addresses = {server: {} for server in servers}
+        addresses6 = {server: {} for server in servers}
+        connect_times = {}
+        streams = {}
+        results = []
+        state = {'done': 0, 'round': 0}
+        deferred = self.connect_test or bool(self.stream_transports)
+        rtts = {}
+
+        def emit(server):
+            stats = self._server_stats(server, samples[server], addresses[server], connect_times, streams.get(server),
+                                       addresses6[server])
+            results.append(stats)
+            if on_result:
+                on_result(stats)
+
+        def on_done(key, resp, dur):
+            server, domain, kind = key
+            state['done'] += 1
+            if resp is not None:
+                rtts.setdefault((server, kind), deque(maxlen=20)).append(dur)
+            if on_progress:
+                on_progress((state['done'] / total) * 100,
+                            f"检测进度: 第 {state['round'] + 1}/{total_rounds} 轮 {state['done']}/{total}")
+            if state['round'] < self.warmup_rounds:
+                return
+            if kind == 'aaaa':
+                if resp is not None and resp['rcode'] == 0:
+                    ips = [rdata for rtype, _, rdata in resp['answers'] if rtype == 28]
+                    if ips:
+                        addresses6[server][domain] = ips
+                return
+            # 随机子域名不存在，NXDOMAIN 说明解析器已完成完整递归；
+            # 截断应答（TC）客户端还需改走 TCP 重查，不算 UDP 成功
+            ok = resp is not None and not resp['tc'] and (resp['rcode'] == 0 or (kind == 'cold' and resp['rcode'] == 3))
+            samples[server][(domain, kind)].append((ok, dur))
+            if ok and kind == 'warm':
+                ips = [rdata for rtype, _, rdata in resp['answers'] if rtype == 1]
+                if ips:
+                    addresses[server][domain] = ips
+            if state['round'] == total_rounds - 1 and all(len(v) == self.rounds for v in samples[server].values()):
+                if not deferred:
+                    emit(server)
+
+        for rnd in range(total_rounds):
+            state['round'] = rnd
+            jobs = [((server, domain, 'warm'), server, domain) for server in servers for domain in self.test_domains]
+            if self.cold_cache:
+                jobs += [((server, domain, 'cold'), server, self._cold_name(domain))
+                         for server in servers for domain in self.test_domains]
+            if self.query_aaaa and rnd == total_rounds - 1:
+                jobs += [((server, domain, 'aaaa'), server, domain, 28)
+                         for server in servers for domain in self.test_domains]
+            limits = self._adaptive_limits(rtts)
+            self._run_queries(jobs, on_done, limit_for=lambda key, server: limits.get((server, key[2]), self.timeout))
+
+        if self.connect_test:
+            # 不同解析器常返回相同地址，按地址去重后统一测建连
+            targets = sorted({ip for table in (addresses, addresses6) for server in servers
+                              for ips in table[server].values() for ip in ips})
+            if on_progress:
+                on_progress(100, f"建连测试: {len(targets)} 个地址...")
+            connect_samples = {ip: [] for ip in targets}
+            for _ in range(self.connect_rounds):
+                for ip, (ok, dur) in self._run_connects([(ip, ip, self.connect_port) for ip in targets]).items():
+                    if ok:
+                        connect_samples[ip].append(dur)
+            for ip, durs in connect_samples.items():
+                connect_times[ip] = statistics.median(durs) if durs else float('inf')
+
+        if self.stream_transports:
+            if on_progress:
+                on_progress(100, f"TCP/DoT 检测: {len(servers)} 个DNS...")
+            streams.update(self._run_stream_probes(servers))
+
+        if deferred:
+            for server in servers:
+                emit(server)
+        return results
 
-    def _test_server(self, server):
+    def _run_stream_probes(self, servers):
+        jobs = [(server, transport) for server in servers for transport in self.stream_transports]
+        out = {server: {} for server in servers}
+        if not jobs:
+            return out
+        with ThreadPoolExecutor(max_workers=min(32, len(jobs))) as pool:
+            for (server, transport), res in zip(jobs, pool.map(lambda job: self._stream_probe(*job), jobs)):
+                out[server][transport] = res
+        return out
+
+    def _stream_probe(self, server, transport):
+        # 单连接：先测 TCP 建连与 TLS 握手，再在同一连接上多轮流水线发送全部测试域名
+        port = self.dot_port if transport == 'dot' else self.tcp_port
+        # reuse_supported：首批之后服务端关闭连接时为 False（合法的"不支持复用"，不算失败）
+        result = {'connect': float('inf'), 'tls': 0.0, 'handshake': float('inf'),
+                  'first': float('inf'), 'reuse': float('inf'), 'loss': 1.0, 'reuse_supported': None}
+        sock = None
+        try:
+            start = time.perf_counter()
+            sock = socket.create_connection((server, port), timeout=self.timeout)
+            connected = time.perf_counter()
+            result['connect'] = connected - start
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            if transport == 'dot':
+                ctx = ssl.create_default_context()
+                if not self.dot_verify:
+                    ctx.check_hostname = False
+                    ctx.verify_mode = ssl.CERT_NONE
+                sock = ctx.wrap_socket(sock, server_hostname=server)
+                result['tls'] = time.perf_counter() - connected
+            result['handshake'] = time.perf_counter() - start
+            first, closed = self._stream_batch(sock)
+            ok_first = [d for d in first if d is not None]
+            result['first'] = statistics.median(ok_first) if ok_first else float('inf')
+            sent = list(first)
+            reuse = []
+            for _ in range(self.rounds):
+                if closed:
+                    break
+                batch, closed = self._stream_batch(sock)
+                if closed and not any(d is not None for d in batch):
+                    # 连接在两批之间被关闭：这一批根本没有被服务端处理，不计入丢包
+                    break
+                sent.extend(batch)
+                reuse.extend(d for d in batch if d is not None)
+            if ok_first:
+                result['reuse_supported'] = bool(reuse) or not closed
+            result['reuse'] = statistics.median(reuse) if reuse else float('inf')
+            result['loss'] = 1 - sum(1 for d in sent if d is not None) / len(sent) if sent else 1.0
+        except Exception:
+            pass
+        finally:
+            if sock is not None:
+                try:
+                    sock.close()
+                except Exception:
+                    pass
+        return result
+
+    def _stream_batch(self, sock):
+        # RFC 7766 流水线：一次写出全部带 2 字节长度前缀的查询，应答可乱序返回，按事务ID匹配。
+        # 超时或连接被关闭时返回已收到的部分：(按查询顺序的耗时列表，未应答为 None；连接是否已关闭)
+        tids = random.sample(range(0x10000), len(self.test_domains))
+        wire = b''.join(struct.pack('!H', len(q)) + q
+                        for q in (self._build_query(tid, d) for tid, d in zip(tids, self.test_domains)))
+        waiting = set(tids)
+        latencies = {}
+        closed = False
+        start = time.perf_counter()
+        deadline = start + self.timeout
+        try:
+            sock.sendall(wire)
+        except OSError:
+            return [None] * len(tids), True
+        while waiting:
+            try:
+                length = struct.unpack('!H', self._recv_exact(sock, 2, deadline))[0]
+                data = self._recv_exact(sock, length, deadline)
+            except socket.timeout:
+                break
+            except (OSError, ConnectionError, ValueError):
+                closed = True
+                break
+            resp = self._parse_response(data)
+            if resp is None or resp['tid'] not in waiting:
+                continue
+            waiting.discard(resp['tid'])
+            if resp['rcode'] == 0:
+                latencies[resp['tid']] = time.perf_counter() - start
+        return [latencies.get(tid) for tid in tids], closed
+
+    def _recv_exact(self, sock, size, deadline):
+        buf = b''
+        while len(buf) < size:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                raise socket.timeout("stream read timed out")
+            sock.settimeout(remaining)
+            chunk = sock.recv(size - len(buf))
+            if not chunk:
+                raise ValueError("connection closed")
+            buf += chunk
+        return buf
+
+    def _matrix_sweep(self, servers, domains, on_result=None, on_progress=None):
+        matrix = LatencyMatrix(servers, domains)
+        self.matrix = matrix
+        cols = len(domains)
+        # 先用一个常用域做存活探测，不可达的解析器不再逐个域名查询
+        probe = self._run_queries((i, server, self.test_domains[0]) for i, server in enumerate(servers))
+        alive = [i for i in range(len(servers)) if probe[i][0] is not None]
+        total = max(1, len(alive) * cols * self.matrix_rounds)
+        step = max(1, total // 200)
+        state = {'done': 0}
+
+        def on_done(key, resp, dur):
+            state['done'] += 1
+            # 日志中的域名可能已失效，NXDOMAIN 同样算作解析器给出了应答
+            if resp is not None and resp['rcode'] in (0, 3):
+                matrix.record(key, dur)
+            if on_progress and (state['done'] % step == 0 or state['done'] == total):
+                on_progress((state['done'] / total) * 100, f"矩阵检测: {state['done']}/{total}")
+
+        for _ in range(self.matrix_rounds):
+            jobs = ((i * cols + j, servers[i], domain) for i in alive for j, domain in enumerate(domains))
+            self._run_queries(jobs, on_done, collect=False, max_inflight=self.matrix_inflight)
+
+        results = []
+        for i, server in enumerate(servers):
+            stats = self._matrix_server_stats(matrix, i)
+            results.append(stats)
+            if on_result:
+                on_result(stats)
+        return results
+
+    def _matrix_server_stats(self, matrix, i):
+        count, p50, p95, jitter, j_min, j_max = matrix.row_summary(i)
+        fastest = (None, float('inf'))
+        slowest = (None, 0)
+        if count:
+            fastest = (matrix.domains[j_min], matrix.get(i, j_min))
+            slowest = (matrix.domains[j_max], matrix.get(i, j_max))
+        return {
+            'server': matrix.servers[i],
+            'p50': p50,
+            'p95': p95,
+            'jitter': jitter,
+            'loss': 1 - count / matrix.cols if matrix.cols else 1.0,
+            'cold_p50': float('inf'),
+            'cold_loss': None,
+            'connect': None,
+            'e2e': None,
+            'v6_connect': None,
+            'v6_first_gain': None,
+            'tcp': None,
+            'dot': None,
+            'fast': fastest,
+            'slow': slowest,
+        }
+
+    def _write_matrix_csv(self, matrix, path):
+        with open(path, 'w', encoding='utf-8-sig', newline='') as f:
+            f.write(','.join(['domain', 'best_server', 'best_ms', 'coverage'] + matrix.servers) + '\n')
+            for j, (domain, (best, best_value, coverage)) in enumerate(zip(matrix.domains, matrix.domain_bests())):
+                cells = [f"{v*1000:.1f}" if v == v else '' for v in matrix.column(j)]
+                best_ms = f"{best_value*1000:.1f}" if best is not None else ''
+                f.write(','.join([domain, best or '', best_ms, f"{coverage:.2f}"] + cells) + '\n')
+
+    def _cold_name(self, domain):
+        return f"probe-{random.getrandbits(48):012x}.{domain}"
+
+    def _percentile(self, values, q):
+        if not values:
+            return float('inf')
+        ordered = sorted(values)
+        pos = (len(ordered) - 1) * q
+        lo = int(pos)
+        hi = min(lo + 1, len(ordered) - 1)
+        return ordered[lo] + (ordered[hi] - ordered[lo]) * (pos - lo)
+
+    def _first_connect(self, ips, connect_times):
+        # 与 socket.create_connection 一致：按应答顺序尝试，取第一个连得上的地址的建连耗时
+        for ip in ips:
+            conn = connect_times.get(ip, float('inf'))
+            if conn != float('inf'):
+                return conn
+        return float('inf')
+
+    def _server_stats(self, server, samples, addresses=None, connect_times=None, streams=None, addresses6=None):
         durations = []
-        successes = 0
+        sent = 0
+        e2e = []
+        connects = []
+        v6_connects = []
+        he_gains = []
         fastest = (None, float('inf'))
         slowest = (None, 0)
         for domain in self.test_domains:
-            ok, dur = self._dns_query(server, domain)
-            if ok:
-                successes += 1
-                durations.append(dur)
-                if dur < fastest[1]:
-                    fastest = (domain, dur)
-                if dur > slowest[1]:
-                    slowest = (domain, dur)
-        avg = sum(durations) / len(durations) if durations else float('inf')
-        success_rate = successes / len(self.test_domains)
+            domain_samples = samples.get((domain, 'warm'), [])
+            sent += len(domain_samples)
+            ok_durs = [dur for ok, dur in domain_samples if ok]
+            if not ok_durs:
+                continue
+            durations.extend(ok_durs)
+            med = statistics.median(ok_durs)
+            ips = (addresses or {}).get(domain)
+            if ips and connect_times:
+                conn = self._first_connect(ips, connect_times)
+                connects.append(conn)
+                e2e.append(med + conn)
+                ips6 = (addresses6 or {}).get(domain)
+                if ips6:
+                    # Happy Eyeballs（RFC 8305）：先连 v6，he_delay 后补发 v4，谁先成功用谁
+                    # v6 连不上（含本机无 IPv6 路由时的立即失败）记为 inf，Happy Eyeballs 退回 he_delay 后的 v4
+                    conn6 = self._first_connect(ips6, connect_times)
+                    v6_connects.append(conn6)
+                    he = min(conn6, self.he_delay + conn)
+                    if he != float('inf') and conn != float('inf'):
+                        he_gains.append(conn - he)
+            if med < fastest[1]:
+                fastest = (domain, med)
+            if med > slowest[1]:
+                slowest = (domain, med)
+        cold = [s for domain in self.test_domains for s in samples.get((domain, 'cold'), [])]
+        cold_durs = [dur for ok, dur in cold if ok]
         return {
             'server': server,
-            'avg': avg,
-            'rate': success_rate,
+            'p50': self._percentile(durations, 0.5),
+            'p95': self._percentile(durations, 0.95),
+            'jitter': statistics.pstdev(durations) if len(durations) > 1 else 0.0,
+            'loss': 1 - len(durations) / sent if sent else 1.0,
+            'cold_p50': self._percentile(cold_durs, 0.5),
+            'cold_loss': 1 - len(cold_durs) / len(cold) if cold else None,
+            'connect': statistics.median(connects) if connects else float('inf'),
+            'e2e': statistics.median(e2e) if e2e else float('inf'),
+            'v6_connect': (statistics.median([c for c in v6_connects if c != float('inf')])
+                           if any(c != float('inf') for c in v6_connects) else float('inf')) if v6_connects else None,
+            'v6_first_gain': statistics.median(he_gains) if he_gains else None,
+            'tcp': (streams or {}).get('tcp'),
+            'dot': (streams or {}).get('dot'),
             'fast': fastest,
             'slow': slowest,
         }
 
-    def _dns_query(self, server, domain):
+    def _ranked(self):
+        return self._rank(self.results)
+
+    def _rank(self, results):
+        usable = [r for r in results if r['p50'] != float('inf')]
+        if self.connect_test:
+            usable.sort(key=lambda x: (round(x['loss'], 2), x['e2e'] if x['e2e'] is not None else x['p50'],
+                                       x['p50'], x['p95'], x['jitter']))
+        else:
+            usable.sort(key=lambda x: (round(x['loss'], 2), x['p50'], x['p95'], x['jitter']))
+        return usable
+
+    def _read_name(self, data, offset):
+        labels = []
+        jumped_end = None
+        hops = 0
+        while True:
+            length = data[offset]
+            if length & 0xC0 == 0xC0:
+                if jumped_end is None:
+                    jumped_end = offset + 2
+                offset = ((length & 0x3F) << 8) | data[offset + 1]
+                hops += 1
+                if hops > 32:
+                    raise ValueError("compression loop")
+                continue
+            offset += 1
+            if length == 0:
+                break
+            labels.append(data[offset:offset + length].decode('ascii', 'replace'))
+            offset += length
+        return '.'.join(labels), (jumped_end if jumped_end is not None else offset)
+
+    def _parse_response(self, data):
+        if len(data) < 12:
+            return None
+        tid, flags, qdcount, ancount, nscount, arcount = struct.unpack('!HHHHHH', data[:12])
+        resp = {'tid': tid, 'rcode': flags & 0x0F, 'tc': bool(flags & 0x0200), 'ancount': ancount,
+                'question': None, 'answers': []}
         try:
-            tid = int(time.time() * 1000) & 0xFFFF
-            header = struct.pack('!HHHHHH', tid, 0x0100, 1, 0, 0, 0)
-            qname = b''.join(len(label).to_bytes(1, 'big') + label.encode('ascii') for label in domain.split('.')) + b'\x00'
-            question = qname + struct.pack('!HH', 1, 1)
-            packet = header + question
-            sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-            sock.settimeout(self.timeout)
-            start = time.time()
-            sock.sendto(packet, (server, 53))
-            data, _ = sock.recvfrom(2048)
-            end = time.time()
-            if len(data) < 12:
-                return False, self.timeout
-            ancount = struct.unpack('!H', data[6:8])[0]
-            rcode = data[3] & 0x0F
-            sock.close()
-            ok = (rcode == 0) and (ancount >= 0)
-            return ok, end - start
-        except Exception:
-            return False, self.timeout
+            offset = 12
+            for _ in range(qdcount):
+                name, offset = self._read_name(data, offset)
+                qtype, qclass = struct.unpack('!HH', data[offset:offset + 4])
+                offset += 4
+                if resp['question'] is None:
+                    resp['question'] = (name.lower(), qtype)
+            for _ in range(ancount):
+                _, offset = self._read_name(data, offset)
+                rtype, rclass, ttl, rdlen = struct.unpack('!HHIH', data[offset:offset + 10])
+                offset += 10
+                rdata = data[offset:offset + rdlen]
+                offset += rdlen
+                if rtype == 1 and rdlen == 4:
+                    resp['answers'].append((rtype, ttl, socket.inet_ntop(socket.AF_INET, rdata)))
+                elif rtype == 28 and rdlen == 16:
+                    resp['answers'].append((rtype, ttl, socket.inet_ntop(socket.AF_INET6, rdata)))
+        except (IndexError, ValueError, struct.error):
+            # 报文截断或格式异常：保留已解析的部分
+            pass
+        return resp
+
+    def _build_query(self, tid, domain, qtype=1):
+        header = struct.pack('!HHHHHH', tid, 0x0100, 1, 0, 0, 0)
+        qname = b''.join(len(label).to_bytes(1, 'big') + label.encode('ascii') for label in domain.split('.')) + b'\x00'
+        return header + qname + struct.pack('!HH', qtype, 1)
+
+    def _checkout_sockets(self, server):
+        # 每个服务器维护若干长连接（connect 过的）UDP 套接字，跨轮次/跨检测复用；
+        # 借出期间独占，避免并发的检测互相读走对方的应答。
+        with self._udp_pool_lock:
+            idle = self._udp_pool.setdefault(server, [])
+            socks = [idle.pop() for _ in range(min(len(idle), self.sockets_per_server))]
+        while len(socks) < self.sockets_per_server:
+            sock = socket.socket(self._family(server), socket.SOCK_DGRAM)
+            try:
+                sock.setblocking(False)
+                try:
+                    # 大量并发应答集中到达时避免内核接收缓冲区溢出丢包
+                    sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 1 << 20)
+                except OSError:
+                    pass
+                sock.connect((server, self.udp_port))
+            except OSError:
+                sock.close()
+                raise
+            socks.append(sock)
+        return socks
+
+    def _checkin_sockets(self, server, socks):
+        with self._udp_pool_lock:
+            idle = self._udp_pool.setdefault(server, [])
+            for sock in socks:
+                if len(idle) < self.sockets_per_server:
+                    idle.append(sock)
+                else:
+                    sock.close()
+
+    def close_sockets(self):
+        with self._udp_pool_lock:
+            pool, self._udp_pool = self._udp_pool, {}
+        for socks in pool.values():
+            for sock in socks:
+                sock.close()
+
+    def _next_tid(self, server, inflight):
+        # 随机事务ID，同时避开在途查询与该服务器最近用过的ID（防止迟到应答被误配）
+        history = self._tid_history.get(server)
+        if history is None:
+            history = self._tid_history[server] = (deque(maxlen=4096), set())
+        order, used = history
+        while True:
+            tid = random.getrandbits(16)
+            if tid not in used and (server, tid) not in inflight:
+                break
+        if len(order) == order.maxlen:
+            used.discard(order[0])
+        order.append(tid)
+        used.add(tid)
+        return tid
+
+    def _adaptive_limits(self, rtts):
+        # 每个 (服务器, 查询类型) 的超时取其近期最大应答耗时的 timeout_factor 倍，限制在 [timeout_floor, timeout]；
+        # 一轮要等所有查询结束，丢包的查询不必再等满固定超时。样本少于 3 个时用固定超时。
+        return {k: min(self.timeout, max(self.timeout_floor, max(v) * self.timeout_factor))
+                for k, v in rtts.items() if len(v) >= 3}
+
+    def _run_queries(self, jobs, on_done=None, collect=True, max_inflight=None, limit_for=None):
+        # 所有 (服务器, 域名) 查询同时在途，每个服务器使用连接池中的 UDP 套接字；
+        # 应答按 (服务器, 事务ID) 匹配并校验问题段回显，在途数量受 max_inflight 限制。
+        # jobs 可以是生成器；collect=False 时不保留结果，仅通过 on_done 回调。
+        # limit_for(key, server) 给出单个查询的超时，缺省为 self.timeout。
+        results = {}
+        expiry = []
+        seq = itertools.count()
+        pending = iter(jobs)
+        exhausted = False
+        inflight = {}
+        cap = max_inflight or self.max_inflight
+        borrowed = {}
+        rotation = {}
+
+        def finish(key, resp, dur):
+            if collect:
+                results[key] = (resp, dur)
+            if on_done:
+                on_done(key, resp, dur)
+
+        sel = selectors.DefaultSelector()
+        try:
+            while not exhausted or inflight:
+                while not exhausted and len(inflight) < cap:
+                    job = next(pending, None)
+                    if job is None:
+                        exhausted = True
+                        break
+                    key, server, domain = job[:3]
+                    qtype = job[3] if len(job) > 3 else 1
+                    try:
+                        if server not in borrowed:
+                            borrowed[server] = self._checkout_sockets(server)
+                            for sock in borrowed[server]:
+                                sel.register(sock, selectors.EVENT_READ, server)
+                            rotation[server] = 0
+                        socks = borrowed[server]
+                        sock = socks[rotation[server] % len(socks)]
+                        rotation[server] += 1
+                        tid = self._next_tid(server, inflight)
+                        packet = self._build_query(tid, domain, qtype)
+                        start = time.perf_counter()
+                        sock.send(packet)
+                    except Exception:
+                        finish(key, None, self.timeout)
+                        continue
+                    inflight[(server, tid)] = (key, start, (domain.lower(), qtype))
+                    limit = limit_for(key, server) if limit_for else self.timeout
+                    heapq.heappush(expiry, (start + limit, next(seq), (server, tid), start, limit))
+
+                if not inflight:
+                    continue
+                # 各查询超时不同，按截止时间小顶堆等待；已应答的堆项惰性丢弃
+                while expiry and inflight.get(expiry[0][2], (None, None))[1] != expiry[0][3]:
+                    heapq.heappop(expiry)
+                wait = max(0.0, expiry[0][0] - time.perf_counter())
+                for sk, _ in sel.select(wait):
+                    sock, server = sk.fileobj, sk.data
+                    while True:
+                        try:
+                            data = sock.recv(2048)
+                        except (BlockingIOError, InterruptedError):
+                            break
+                        except OSError:
+                            # ICMP 端口不可达会以 ConnectionRefused/ConnectionReset 抛出
+                            continue
+                        now = time.perf_counter()
+                        resp = self._parse_response(data)
+                        if resp is None:
+                            continue
+                        entry = inflight.get((server, resp['tid']))
+                        if entry is None or resp['question'] != entry[2]:
+                            # 迟到或伪造的应答：事务ID或问题段对不上，丢弃
+                            continue
+                        del inflight[(server, resp['tid'])]
+                        key, start, _ = entry
+                        finish(key, resp, now - start)
+
+                now = time.perf_counter()
+                while expiry and expiry[0][0] <= now:
+                    _, _, slot, start, limit = heapq.heappop(expiry)
+                    entry = inflight.get(slot)
+                    if entry is None or entry[1] != start:
+                        continue
+                    del inflight[slot]
+                    finish(entry[0], None, limit)
+        finally:
+            sel.close()
+            for server, socks in borrowed.items():
+                self._checkin_sockets(server, socks)
+        return results
+
+    def _run_connects(self, jobs):
+        # 非阻塞 connect 同时在途，可写即表示握手完成（或失败，需看 SO_ERROR）；
+        # connect_ex 立即返回错误（如 ENETUNREACH）的直接记为失败，不进入等待
+        pending_codes = (0, errno.EINPROGRESS, errno.EWOULDBLOCK, getattr(errno, 'WSAEWOULDBLOCK', errno.EWOULDBLOCK))
+        results = {}
+        inflight = {}
+        sel = selectors.DefaultSelector()
+        try:
+            for key, ip, port in jobs:
+                try:
+                    sock = socket.socket(self._family(ip), socket.SOCK_STREAM)
+                    sock.setblocking(False)
+                    start = time.perf_counter()
+                    code = sock.connect_ex((ip, port))
+                except Exception:
+                    results[key] = (False, self.timeout)
+                    continue
+                if code not in pending_codes:
+                    results[key] = (False, self.timeout)
+                    sock.close()
+                    continue
+                inflight[sock] = (key, start)
+                sel.register(sock, selectors.EVENT_WRITE)
+            deadline = time.perf_counter() + self.timeout
+            while inflight:
+                wait = deadline - time.perf_counter()
+                if wait <= 0:
+                    break
+                for sk, _ in sel.select(wait):
+                    now = time.perf_counter()
+                    sock = sk.fileobj
+                    key, start = inflight.pop(sock)
+                    sel.unregister(sock)
+                    ok = sock.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR) == 0
+                    results[key] = (ok, now - start if ok else self.timeout)
+                    sock.close()
+            for sock, (key, _) in inflight.items():
+                results[key] = (False, self.timeout)
+                sock.close()
+        finally:
+            sel.close()
+        return results
+
+    def _dns_query(self, server, domain):
+        resp, dur = self._run_queries([(domain, server, domain)])[domain]
+        return resp is not None and resp['rcode'] == 0, dur
 
     def update_progress(self, value, text):
+        if self.root is None:
+            return
         self.progress_var.set(value)
         self.status_label.config(text=text)
 
+    def _fmt_ms(self, value):
+        return f"{value*1000:.1f}ms" if value != float('inf') else "失败"
+
+    def _fmt_v6_gain(self, stats):
+        if stats['v6_connect'] is None:
+            return "无AAAA" if self.connect_test and self.query_aaaa and stats['e2e'] is not None else "-"
+        if stats['v6_connect'] == float('inf'):
+            return "无 IPv6"
+        if stats['v6_first_gain'] is None:
+            return "v6不通"
+        gain = stats['v6_first_gain']
+        return f"快 {gain*1000:.0f}ms" if gain > 0 else f"慢 {-gain*1000:.0f}ms"
+
+    def _fmt_stream(self, probe):
+        if not probe:
+            return "-"
+        if probe.get('reuse_supported') is False:
+            return f"不支持复用 ({probe['first']*1000:.1f}ms)"
+        if probe['reuse'] == float('inf'):
+            return "失败"
+        return f"{probe['reuse']*1000:.1f}ms (+{probe['handshake']*1000:.0f})"
+
     def update_result(self, stats):
-        avg_ms = f"{stats['avg']*1000:.1f}ms" if stats['avg'] != float('inf') else "失败"
-        rate = f"{int(stats['rate']*100)}%"
+        if self.root is None:
+            self._emit(dict(stats, type='result'))
+            return
+        p50 = self._fmt_ms(stats['p50'])
+        p95 = self._fmt_ms(stats['p95'])
+        jitter = f"{stats['jitter']*1000:.1f}ms" if stats['p50'] != float('inf') else "-"
+        loss = f"{int(round(stats['loss']*100))}%"
+        cold = self._fmt_ms(stats['cold_p50']) if stats['cold_loss'] is not None else "-"
+        e2e = self._fmt_ms(stats['e2e']) if self.connect_test and stats['e2e'] is not None else "-"
+        v6 = self._fmt_v6_gain(stats)
         fast = f"{stats['fast'][0]} ({stats['fast'][1]*1000:.1f}ms)" if stats['fast'][0] else "-"
         slow = f"{stats['slow'][0]} ({stats['slow'][1]*1000:.1f}ms)" if stats['slow'][0] else "-"
-        tag = 'good' if stats['rate'] >= 0.6 and stats['avg'] < float('inf') else 'bad'
-        self.tree.insert('', 'end', values=(stats['server'], avg_ms, rate, fast, slow), tags=(tag,))
+        tag = 'good' if stats['loss'] <= 0.4 and stats['p50'] < float('inf') else 'bad'
+        self.tree.insert('', 'end', values=(stats['server'], p50, p95, jitter, loss, cold, e2e, v6,
+                                              self._fmt_stream(stats['tcp']), self._fmt_stream(stats['dot']), fast, slow), tags=(tag,))
         if not hasattr(self, 'tree_style'):
             self.tree.tag_configure('good', foreground='#006400', background='#F0FFF0')
             self.tree.tag_configure('bad', foreground='#8B0000', background='#FFF0F0')
 
     def test_complete(self):
         self.is_testing = False
+        if self.root is None:
+            if self.matrix is not None:
+                for domain, (best, best_value, coverage) in zip(self.matrix.domains, self.matrix.domain_bests()):
+                    self._emit({'type': 'domain', 'domain': domain, 'best_server': best,
+                                'best': best_value, 'coverage': coverage})
+            self._emit({'type': 'summary', 'ranking': [r['server'] for r in self._ranked()]})
+            return
         self.test_btn.config(text="🚀 开始检测", state=tk.NORMAL)
         self.load_btn.config(state=tk.NORMAL)
         self.import_btn.config(state=tk.NORMAL)
         self.clear_btn.config(state=tk.NORMAL)
 
-        sorted_res = [r for r in self.results if r['avg'] != float('inf')]
-        sorted_res.sort(key=lambda x: (-(x['rate']), x['avg']))
+        sorted_res = self._ranked()
         if sorted_res:
             self.copy_best_btn.config(state=tk.NORMAL)
             self.copy_ps_btn.config(state=tk.NORMAL)
+            self.forward_btn.config(state=tk.NORMAL)
             best = ', '.join(r['server'] for r in sorted_res[:2])
-            self.status_label.config(text=f"✅ 推荐DNS: {best}")
+            text = f"✅ 推荐DNS: {best}"
+            if self.matrix is not None:
+                text += f" | 矩阵 {len(self.matrix.servers)}×{self.matrix.cols}，域名平均覆盖率 {self.matrix.mean_coverage()*100:.1f}%"
+            self.status_label.config(text=text)
         else:
             self.copy_best_btn.config(state=tk.DISABLED)
             self.copy_ps_btn.config(state=tk.DISABLED)
@@ -303,17 +1060,34 @@ class DNSOptimalTester:
             with open(log_path, 'w', encoding='utf-8') as f:
                 f.write("DNS 最优检测日志\n")
                 f.write("=" * 60 + "\n\n")
-                f.write(f"测试时间: {time.strftime('%Y-%m-%d %H:%M:%S')}\n\n")
+                f.write(f"测试时间: {time.strftime('%Y-%m-%d %H:%M:%S')}\n")
+                f.write(f"采样轮数: {self.rounds} (预热 {self.warmup_rounds} 轮不计)\n\n")
                 for r in self.results:
-                    avg = f"{r['avg']*1000:.1f}ms" if r['avg'] != float('inf') else "失败"
-                    rate = f"{int(r['rate']*100)}%"
-                    f.write(f"{r['server']:>15}  平均: {avg:<8}  成功率: {rate}\n")
+                    p50 = self._fmt_ms(r['p50'])
+                    p95 = self._fmt_ms(r['p95'])
+                    loss = f"{int(round(r['loss']*100))}%"
+                    line = f"{r['server']:>15}  中位: {p50:<8}  P95: {p95:<8}  抖动: {r['jitter']*1000:.1f}ms  丢包率: {loss}"
+                    if r['cold_loss'] is not None:
+                        line += f"  冷缓存中位: {self._fmt_ms(r['cold_p50'])}"
+                    if self.connect_test and r['e2e'] is not None:
+                        line += f"  建连: {self._fmt_ms(r['connect'])}  解析+连接: {self._fmt_ms(r['e2e'])}"
+                    if r.get('v6_connect') is not None:
+                        line += f"  v6建连: {self._fmt_ms(r['v6_connect'])}  v6优先: {self._fmt_v6_gain(r)}"
+                    for transport in ('tcp', 'dot'):
+                        probe = r.get(transport)
+                        if probe:
+                            line += (f"  {transport.upper()}: 握手 {self._fmt_ms(probe['handshake'])}"
+                                     f" 首批 {self._fmt_ms(probe['first'])} 复用 "
+                                     f"{'不支持' if probe.get('reuse_supported') is False else self._fmt_ms(probe['reuse'])}"
+                                     f" 丢包 {int(round(probe['loss']*100))}%")
+                    f.write(line + "\n")
+            if self.matrix is not None:
+                self._write_matrix_csv(self.matrix, os.path.join(self.archive_dir, f"dns_matrix_{ts}.csv"))
         except Exception:
             pass
 
     def copy_best(self):
-        sorted_res = [r for r in self.results if r['avg'] != float('inf')]
-        sorted_res.sort(key=lambda x: (-(x['rate']), x['avg']))
+        sorted_res = self._ranked()
         if not sorted_res:
             return
         best_servers = [r['server'] for r in sorted_res[:2]]
@@ -326,8 +1100,7 @@ class DNSOptimalTester:
             messagebox.showerror("错误", f"复制失败: {e}")
 
     def copy_ps_commands(self):
-        sorted_res = [r for r in self.results if r['avg'] != float('inf')]
-        sorted_res.sort(key=lambda x: (-(x['rate']), x['avg']))
+        sorted_res = self._ranked()
         if not sorted_res:
             return
         servers = [r['server'] for r in sorted_res[:2]]
@@ -341,6 +1114,26 @@ class DNSOptimalTester:
         except Exception as e:
             messagebox.showerror("错误", f"复制失败: {e}")
 
+    def toggle_forwarder(self):
+        if self.forwarder is not None:
+            self.forwarder.stop()
+            self.forwarder = None
+            self.forward_btn.config(text="🛰️ 启动本地转发")
+            self.status_label.config(text="本地转发已停止")
+            return
+        ranking = [r['server'] for r in self._ranked()]
+        if not ranking:
+            return
+        forwarder = DNSForwarder(self, self.tested_servers or ranking, port=self.forward_port, top_n=self.forward_top_n)
+        try:
+            forwarder.start(ranking)
+        except Exception as e:
+            messagebox.showerror("错误", f"无法启动本地转发: {e}")
+            return
+        self.forwarder = forwarder
+        self.forward_btn.config(text="⏹️ 停止本地转发")
+        self.status_label.config(text=f"✅ 本地转发已启动 127.0.0.1:{self.forward_port} → {', '.join(forwarder.upstreams)}")
+
     def open_archive_dir(self):
         try:
             os.makedirs(self.archive_dir, exist_ok=True)
@@ -349,10 +1142,341 @@ class DNSOptimalTester:
             messagebox.showerror("错误", f"无法打开目录: {e}")
 
 
+class DNSForwarder:
+    # 本地竞速转发：每个查询同时发往排名前 N 的上游，取最先返回的有效应答；
+    # 应答按 TTL 缓存（LRU 淘汰），上游排名由后台线程周期性复测刷新。
+    def __init__(self, tester, servers, port=5300, top_n=3, cache_size=4096, refresh_interval=600):
+        self.tester = tester
+        self.servers = list(servers)
+        self.port = port
+        self.top_n = top_n
+        self.cache_size = cache_size
+        self.refresh_interval = refresh_interval
+        self.upstreams = list(servers[:top_n])
+        self.cache = OrderedDict()
+        self.pending = {}
+        self.running = False
+        self.stop_event = threading.Event()
+        self.sock = None
+        self.upstream_socks = {}
+        self.stats = {'queries': 0, 'hits': 0, 'servfail': 0}
+
+    def start(self, ranking=None):
+        if ranking:
+            self.upstreams = list(ranking[:self.top_n])
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.bind(('127.0.0.1', self.port))
+        self.sock.setblocking(False)
+        for family in (socket.AF_INET, socket.AF_INET6):
+            try:
+                sock = socket.socket(family, socket.SOCK_DGRAM)
+            except OSError:
+                continue
+            sock.setblocking(False)
+            self.upstream_socks[family] = sock
+        self.running = True
+        self.stop_event.clear()
+        for target in (self._serve, self._refresh_loop):
+            t = threading.Thread(target=target)
+            t.daemon = True
+            t.start()
+
+    def stop(self):
+        self.running = False
+        self.stop_event.set()
+
+    def _refresh_loop(self):
+        while not self.stop_event.wait(self.refresh_interval):
+            try:
+                ranked = self.tester._rank(self.tester._sweep(self.servers))
+            except Exception:
+                continue
+            if ranked:
+                self.upstreams = [r['server'] for r in ranked[:self.top_n]]
+
+    def _serve(self):
+        sel = selectors.DefaultSelector()
+        sel.register(self.sock, selectors.EVENT_READ, self._on_client)
+        for sock in self.upstream_socks.values():
+            sel.register(sock, selectors.EVENT_READ, self._on_upstream)
+        try:
+            while self.running:
+                for key, _ in sel.select(0.2):
+                    while True:
+                        try:
+                            data, src = key.fileobj.recvfrom(4096)
+                        except (BlockingIOError, InterruptedError):
+                            break
+                        except OSError:
+                            continue
+                        try:
+                            key.data(data, src)
+                        except Exception:
+                            pass
+                self._expire_pending()
+        finally:
+            sel.close()
+            self.sock.close()
+            for sock in self.upstream_socks.values():
+                sock.close()
+
+    def _on_client(self, data, client):
+        query = self.tester._parse_response(data)
+        if query is None or query['question'] is None:
+            return
+        self.stats['queries'] += 1
+        cache_key = query['question']
+        cached = self._cache_get(cache_key)
+        if cached is not None:
+            self.stats['hits'] += 1
+            self.sock.sendto(data[:2] + cached[2:], client)
+            return
+        entry = {'client': client, 'query': data, 'question': cache_key, 'done': False,
+                 'start': time.perf_counter(), 'slots': []}
+        for server in self.upstreams:
+            addr = (self.tester._canonical(server), self.tester.udp_port)
+            tid = random.getrandbits(16)
+            while (addr, tid) in self.pending:
+                tid = random.getrandbits(16)
+            try:
+                self.upstream_socks[self.tester._family(server)].sendto(struct.pack('!H', tid) + data[2:], addr)
+            except (KeyError, OSError):
+                continue
+            self.pending[(addr, tid)] = entry
+            entry['slots'].append((addr, tid))
+        if not entry['slots']:
+            self._servfail(entry)
+
+    def _on_upstream(self, data, src):
+        resp = self.tester._parse_response(data)
+        if resp is None:
+            return
+        entry = self.pending.pop((src[:2], resp['tid']), None)
+        if entry is None or entry['done']:
+            return
+        if resp['question'] != entry['question'] or resp['rcode'] not in (0, 3):
+            # 上游拒绝或应答不匹配：等待其他上游，全部失败时由超时返回 SERVFAIL
+            return
+        entry['done'] = True
+        for slot in entry['slots']:
+            self.pending.pop(slot, None)
+        self.sock.sendto(entry['query'][:2] + data[2:], entry['client'])
+        if not resp['tc']:
+            self._cache_put(entry['question'], data)
+
+    def _expire_pending(self):
+        now = time.perf_counter()
+        for slot, entry in list(self.pending.items()):
+            if entry['start'] + self.tester.timeout > now:
+                break
+            del self.pending[slot]
+            if not entry['done']:
+                entry['done'] = True
+                self._servfail(entry)
+
+    def _servfail(self, entry):
+        self.stats['servfail'] += 1
+        query = entry['query']
+        flags = struct.unpack('!H', query[2:4])[0]
+        # QR=1, RA=1, 保留 Opcode/RD，RCODE=2
+        flags = (flags & 0x7900) | 0x8082
+        try:
+            _, qend = self.tester._read_name(query, 12)
+            qend += 4
+            header = query[:2] + struct.pack('!HHHHH', flags, 1, 0, 0, 0)
+            self.sock.sendto(header + query[12:qend], entry['client'])
+        except (IndexError, ValueError, OSError):
+            pass
+
+    def _ttl_fields(self, data):
+        # 返回所有资源记录 TTL 字段的 (偏移, TTL)，跳过 EDNS 的 OPT 伪记录
+        fields = []
+        qdcount, ancount, nscount, arcount = struct.unpack('!HHHH', data[4:12])
+        offset = 12
+        for _ in range(qdcount):
+            _, offset = self.tester._read_name(data, offset)
+            offset += 4
+        for _ in range(ancount + nscount + arcount):
+            _, offset = self.tester._read_name(data, offset)
+            rtype, _, ttl, rdlen = struct.unpack('!HHIH', data[offset:offset + 10])
+            if rtype != 41:
+                fields.append((offset + 4, ttl))
+            offset += 10 + rdlen
+        return fields
+
+    def _cache_put(self, key, data):
+        try:
+            fields = self._ttl_fields(data)
+        except (IndexError, ValueError, struct.error):
+            return
+        if not fields:
+            return
+        ttl = min(t for _, t in fields)
+        if ttl <= 0:
+            return
+        self.cache[key] = (data, fields, time.monotonic(), ttl)
+        self.cache.move_to_end(key)
+        while len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+
+    def _cache_get(self, key):
+        item = self.cache.get(key)
+        if item is None:
+            return None
+        data, fields, stored, ttl = item
+        elapsed = int(time.monotonic() - stored)
+        if elapsed >= ttl:
+            del self.cache[key]
+            return None
+        self.cache.move_to_end(key)
+        # 按已缓存时长递减各记录 TTL，避免客户端重复缓存超期
+        patched = bytearray(data)
+        for offset, orig in fields:
+            struct.pack_into('!I', patched, offset, max(0, orig - elapsed))
+        return bytes(patched)
+
+
+class LatencyMatrix:
+    # 服务器 × 域名 时延矩阵：按行连续存放在 float32 数组中，未应答记为 NaN。
+    # 安装了 NumPy 时统计量直接在共享同一块内存的二维视图上按行/列整体计算；
+    # 否则退回逐格遍历的纯 Python 实现。
+    def __init__(self, servers, domains):
+        self.servers = list(servers)
+        self.domains = list(domains)
+        self.cols = len(self.domains)
+        self.data = array('f', [float('nan')]) * (len(self.servers) * self.cols)
+
+    def record(self, index, value):
+        # 多轮检测时保留最小值（排队抖动只会让时延变大）
+        current = self.data[index]
+        if current != current or value < current:
+            self.data[index] = value
+
+    def get(self, i, j):
+        return self.data[i * self.cols + j]
+
+    def row(self, i):
+        return self.data[i * self.cols:(i + 1) * self.cols]
+
+    def column(self, j):
+        return self.data[j::self.cols]
+
+    def _grid(self):
+        return np.frombuffer(self.data, dtype=np.float32).reshape(len(self.servers), self.cols)
+
+    def row_summary(self, i):
+        # 返回 (应答数, p50, p95, 标准差, 最快列, 最慢列)，无应答时列号为 None
+        if np is not None:
+            row = self._grid()[i].astype(np.float64)
+            count = int(np.count_nonzero(~np.isnan(row)))
+            if not count:
+                return 0, float('inf'), float('inf'), 0.0, None, None
+            p50, p95 = np.nanpercentile(row, [50, 95])
+            return (count, float(p50), float(p95), float(np.nanstd(row)) if count > 1 else 0.0,
+                    int(np.nanargmin(row)), int(np.nanargmax(row)))
+        finite = [(v, j) for j, v in enumerate(self.row(i)) if v == v]
+        if not finite:
+            return 0, float('inf'), float('inf'), 0.0, None, None
+        values = [v for v, _ in finite]
+        if len(values) > 1:
+            cuts = statistics.quantiles(values, n=20, method='inclusive')
+            p50, p95, jitter = cuts[9], cuts[18], statistics.pstdev(values)
+        else:
+            p50 = p95 = values[0]
+            jitter = 0.0
+        return len(values), p50, p95, jitter, min(finite)[1], max(finite)[1]
+
+    def domain_bests(self):
+        # 每个域名的 (最快服务器, 最快时延, 覆盖率)
+        if np is not None and self.servers:
+            grid = self._grid()
+            answered = ~np.isnan(grid)
+            coverage = answered.mean(axis=0)
+            best = np.where(answered, grid, np.inf).argmin(axis=0)
+            values = grid[best, np.arange(self.cols)]
+            return [(self.servers[i], float(v), float(c)) if c else (None, float('inf'), 0.0)
+                    for i, v, c in zip(best.tolist(), values.tolist(), coverage.tolist())]
+        out = []
+        for j in range(self.cols):
+            column = self.column(j)
+            finite = [(v, i) for i, v in enumerate(column) if v == v]
+            if not finite:
+                out.append((None, float('inf'), 0.0))
+                continue
+            value, i = min(finite)
+            out.append((self.servers[i], value, len(finite) / len(column)))
+        return out
+
+    def mean_coverage(self):
+        if not self.data:
+            return 0.0
+        if np is not None:
+            return float((~np.isnan(self._grid())).mean())
+        return sum(1 for v in self.data if v == v) / len(self.data)
+
 def main():
-    root = tk.Tk()
-    app = DNSOptimalTester(root)
-    root.mainloop()
+    parser = argparse.ArgumentParser(
+        description="DNS 最优检测工具",
+        epilog="离线自测：在本机任意端口启动一个同时监听 UDP/TCP 的 DNS 替身（如 dnsmasq -p 5353），然后运行\n"
+               "  echo 127.0.0.1 | python DNS-test.py --headless -i - --port 5353 --transports tcp\n"
+               "DoT 替身可用 --dot-port 指定（证书默认不校验）。",
+        formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--headless", action="store_true", help="不启动界面，结果以 JSON Lines 输出到标准输出")
+    parser.add_argument("-i", "--input", help="候选DNS列表文件，'-' 表示从标准输入读取（默认 dns.txt 或内置列表）")
+    parser.add_argument("--timeout", type=float, help="单次查询超时（秒）")
+    parser.add_argument("--rounds", type=int, help="采样轮数（不含预热）")
+    parser.add_argument("--transports", default="tcp,dot", help="额外检测的流式传输，逗号分隔：tcp,dot；留空表示仅 UDP")
+    parser.add_argument("--port", type=int, help="UDP/TCP 查询端口（默认 53）")
+    parser.add_argument("--dot-port", type=int, help="DoT 端口（默认 853）")
+    parser.add_argument("--domains", help="批量域名列表文件（每行一个域名或URL），启用 服务器×域名 矩阵检测")
+    parser.add_argument("--serve", type=int, metavar="PORT", help="检测完成后在 127.0.0.1:PORT 启动本地竞速转发（需配合 --headless）")
+    args = parser.parse_args()
+
+    if not args.headless:
+        if tk is None:
+            parser.error("当前环境缺少 tkinter，请使用 --headless")
+        root = tk.Tk()
+        app = DNSOptimalTester(root)
+        root.mainloop()
+        return
+
+    app = DNSOptimalTester()
+    if args.timeout:
+        app.timeout = args.timeout
+    if args.rounds:
+        app.rounds = args.rounds
+    app.stream_transports = [t for t in args.transports.split(',') if t in ('tcp', 'dot')]
+    if args.port:
+        app.udp_port = app.tcp_port = args.port
+    if args.dot_port:
+        app.dot_port = args.dot_port
+    if args.input == '-':
+        content = sys.stdin.read()
+    elif args.input:
+        try:
+            with open(args.input, 'r', encoding='utf-8') as f:
+                content = f.read()
+        except OSError as e:
+            parser.error(f"无法读取DNS列表 {args.input}: {e.strerror or e}")
+    else:
+        content = app._default_server_text()
+    servers = app._parse_servers(content)
+    if not servers:
+        parser.error("未找到有效的DNS服务器")
+    if args.domains:
+        app.bulk_domains = app._load_domain_file(args.domains)
+    ranked = app.run_headless(servers)
+    if args.serve and ranked:
+        forwarder = DNSForwarder(app, servers, port=args.serve, top_n=app.forward_top_n)
+        forwarder.start([r['server'] for r in ranked])
+        app._emit({'type': 'serve', 'listen': f"127.0.0.1:{args.serve}", 'upstreams': forwarder.upstreams})
+        try:
+            while True:
+                time.sleep(3600)
+        except KeyboardInterrupt:
+            forwarder.stop()
+    app.close_sockets()
+    sys.exit(0 if ranked else 1)
 
 
 if __name__ == "__main__":
@@ -1,8 +1,11 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
-import tkinter as tk
-from tkinter import ttk, scrolledtext, messagebox, filedialog
+try:
+    import tkinter as tk
+    from tkinter import ttk, scrolledtext, messagebox, filedialog
+except ImportError:
+    tk = None
 import threading
 import requests
 import time
@@ -10,23 +13,91 @@ import pyperclip
 import os
 import re
 import sys
+import json
+import argparse
+import http.server
+import hashlib
+import shutil
+import tempfile
+import tarfile
+import queue
+import sqlite3
+from collections import OrderedDict
+from urllib.parse import urlparse
+from mirror_common import MirrorProbeMixin
 
-class DockerMirrorTester:
-    def __init__(self, root):
+MANIFEST_ACCEPT = ", ".join((
+    "application/vnd.docker.distribution.manifest.list.v2+json",
+    "application/vnd.oci.image.index.v1+json",
+    "application/vnd.docker.distribution.manifest.v2+json",
+    "application/vnd.oci.image.manifest.v1+json",
+))
+REPO_PATH = re.compile(r'^/v2/(.+?)/(?:manifests|blobs|tags)/')
+BLOB_PATH = re.compile(r'^/v2/.+?/blobs/sha256:([0-9a-f]{64})$')
+
+class DockerMirrorTester(MirrorProbeMixin):
+    user_agent = "Mozilla/5.0 DockerMirrorTester"
+
+    def __init__(self, root=None, output=None):
         self.root = root
-        self.root.title("Docker 镜像源测试工具")
-        self.root.geometry("950x650")
+        self.output = output or sys.stdout
         
         self.timeout = 10
+        self.timeout_floor = 3.0
+        self.adaptive_share = 0.5
+        self.timeout_factor = 4
+        self.hedge_factor = 2
+        self._sweep_latencies = []
+        self._sweep_total = 0
+        self._latency_lock = threading.Lock()
+        self._run_id = 0
+        self._ssl_context = None
+        self.max_workers = 16
+        self.per_host_limit = 2
         self.results = []
+        self.phases = {}
+        self.bench = {}
+        self.bench_bytes = 8 * 1024 * 1024
+        self.bench_seconds = 5
+        self.bench_parallel = 1
+        self.pull_concurrency = 3
+        self.platform = ('linux', 'amd64')
+        self._tokens = {}
+        self._challenges = {}
+        self.chunk_size = 16 * 1024 * 1024
+        self.download_sources = 4
+        self.download_streams = 2
+        self.load = {}
+        self.load_levels = (1, 2, 4, 8, 16)
+        self._token_lock = threading.Lock()
         self.is_testing = False
+        self.proxy = None
+        self.proxy_port = 5000
+        self.proxy_cache_limit = 10 * 1024 ** 3
         self.app_dir = self._get_app_dir()
         self.default_file = os.path.join(self.app_dir, "mirrors.txt")
+        self.proxy_cache_dir = os.path.join(self.app_dir, "registry_cache")
+        self.estimates = {}
+        self.repo_index = None
+        self.repo_index_ttl = 24 * 3600
+        self.repo_index_file = os.path.join(self.app_dir, "repo_index.json")
+        self.search_cache_dir = os.path.join(self.app_dir, "search_cache")
+        self.search_cache_ttl = 3600
+        self.search_max_bytes = 512 * 1024
+        self.full_retest = False
+        self.race_k = 0
+        self.deadline = None
+        self.cancelled = []
+        self.history = MirrorHistory(os.path.join(self.app_dir, "mirror_history.db"))
         self.archive_dir = os.path.join(os.path.expanduser("~"), "Desktop", "Docker镜像源测试_保留")
-        os.makedirs(self.archive_dir, exist_ok=True)
         
-        self.create_widgets()
-        self.load_default_file()
+        if self.root is not None:
+            os.makedirs(self.archive_dir, exist_ok=True)
+            self.root.title("Docker 镜像源测试工具")
+            self.root.geometry("950x650")
+            self.create_widgets()
+            self.load_default_file()
+            self.show_history()
         
     def create_widgets(self):
         """创建界面控件"""
@@ -67,6 +138,15 @@ class DockerMirrorTester:
         
         self.test_btn = ttk.Button(btn_frame, text="🚀 开始测试", command=self.start_test)
         self.test_btn.pack(side=tk.LEFT)
+
+        self.full_retest_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(btn_frame, text="全部复测", variable=self.full_retest_var).pack(side=tk.LEFT, padx=(8, 0))
+
+        self.race_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(btn_frame, text="竞速(前3)", variable=self.race_var).pack(side=tk.LEFT, padx=(8, 0))
+        ttk.Label(btn_frame, text="时限(秒)：").pack(side=tk.LEFT, padx=(8, 0))
+        self.deadline_entry = ttk.Entry(btn_frame, width=5)
+        self.deadline_entry.pack(side=tk.LEFT)
         
         # 进度条
         self.progress_var = tk.DoubleVar()
@@ -81,17 +161,23 @@ class DockerMirrorTester:
         ttk.Label(main_frame, text="测试结果：", font=('Arial', 10, 'bold')).grid(row=6, column=0, sticky=tk.W)
         
         # 树形列表
-        columns = ("状态", "响应时间", "镜像源地址")
+        columns = ("状态", "响应时间", "DNS/TCP/TLS/首字节", "复用请求", "拉取测速", "镜像源地址")
         self.tree = ttk.Treeview(main_frame, columns=columns, show="headings", height=12)
         self.tree.grid(row=7, column=0, columnspan=2, sticky=(tk.W, tk.E, tk.N, tk.S))
         
         self.tree.heading("状态", text="状态")
         self.tree.heading("响应时间", text="响应时间")
+        self.tree.heading("DNS/TCP/TLS/首字节", text="DNS/TCP/TLS/首字节")
+        self.tree.heading("复用请求", text="复用请求")
+        self.tree.heading("拉取测速", text="拉取测速")
         self.tree.heading("镜像源地址", text="镜像源地址")
         
         self.tree.column("状态", width=80, anchor=tk.CENTER)
         self.tree.column("响应时间", width=100, anchor=tk.CENTER)
-        self.tree.column("镜像源地址", width=450)
+        self.tree.column("DNS/TCP/TLS/首字节", width=170, anchor=tk.CENTER)
+        self.tree.column("复用请求", width=120, anchor=tk.CENTER)
+        self.tree.column("拉取测速", width=150, anchor=tk.CENTER)
+        self.tree.column("镜像源地址", width=280)
         
         # 滚动条
         scrollbar = ttk.Scrollbar(main_frame, orient=tk.VERTICAL, command=self.tree.yview)
@@ -117,6 +203,9 @@ class DockerMirrorTester:
         self.copy_btn = ttk.Button(bottom_frame, text="📋 复制配置", command=self.copy_config, state=tk.DISABLED)
         self.copy_btn.pack(side=tk.RIGHT, padx=(5, 0))
 
+        self.proxy_btn = ttk.Button(bottom_frame, text="🛰️ 启动本地代理", command=self.toggle_proxy, state=tk.DISABLED)
+        self.proxy_btn.pack(side=tk.RIGHT, padx=(5, 0))
+
         self.usage_label = ttk.Label(main_frame, text="", font=('Arial', 9), foreground="#333", wraplength=900)
         self.usage_label.grid(row=9, column=0, columnspan=3, sticky=tk.W, pady=(8, 0))
         
@@ -128,6 +217,14 @@ class DockerMirrorTester:
         self.image_entry.insert(0, "ubuntu:latest")
         self.copy_pull_btn = ttk.Button(proxy_frame, text="📋 复制加速拉取命令", command=self.copy_pull_cmd, state=tk.DISABLED)
         self.copy_pull_btn.pack(side=tk.LEFT)
+        self.bench_btn = ttk.Button(proxy_frame, text="📦 拉取测速", command=self.start_benchmark, state=tk.DISABLED)
+        self.bench_btn.pack(side=tk.LEFT, padx=(5, 0))
+        self.download_btn = ttk.Button(proxy_frame, text="⬇️ 多源下载", command=self.start_download, state=tk.DISABLED)
+        self.download_btn.pack(side=tk.LEFT, padx=(5, 0))
+        self.estimate_btn = ttk.Button(proxy_frame, text="⏱️ 预估拉取", command=self.start_estimate, state=tk.DISABLED)
+        self.estimate_btn.pack(side=tk.LEFT, padx=(5, 0))
+        self.load_btn = ttk.Button(proxy_frame, text="📈 并发曲线", command=self.start_load_profile, state=tk.DISABLED)
+        self.load_btn.pack(side=tk.LEFT, padx=(5, 0))
         
     def select_file(self):
         """选择文件"""
@@ -195,8 +292,17 @@ class DockerMirrorTester:
             "Docker registry mirrors 中国",
             "Docker 国内 镜像源 列表"
         ]
-        headers = {"User-Agent": "Mozilla/5.0 DockerMirrorTester"}
+        pattern = re.compile(r'https?://[^\s"\'<>]+')
         candidates = set()
+        lock = threading.Lock()
+        session = self._search_session(self.max_workers)
+
+        def on_page(url, links):
+            with lock:
+                for link in links:
+                    if self._looks_like_mirror(link):
+                        candidates.add(self._normalize_url(link))
+
         try:
             if os.path.exists(self.default_file):
                 try:
@@ -207,15 +313,8 @@ class DockerMirrorTester:
                                 candidates.add(self._normalize_url(line))
                 except Exception:
                     pass
-            for q in queries:
-                url = f"https://duckduckgo.com/html/?q={requests.utils.quote(q)}"
-                try:
-                    r = requests.get(url, headers=headers, timeout=self.timeout)
-                    for link in re.findall(r'https?://[^\s"\'<>]+', r.text):
-                        if self._looks_like_mirror(link):
-                            candidates.add(self._normalize_url(link))
-                except Exception:
-                    pass
+            pages = [f"https://duckduckgo.com/html/?q={requests.utils.quote(q)}" for q in queries]
+            self._run_parallel(pages, lambda url: self._search_links(session, url, pattern), on_page)
             final = sorted(candidates)
             if final:
                 with open(self.default_file, 'w', encoding='utf-8') as f:
@@ -226,6 +325,8 @@ class DockerMirrorTester:
             else:
                 self.root.after(0, lambda: messagebox.showwarning("提示", "未爬取到新的镜像源"))
         finally:
+            session.close()
+
             def reset():
                 try:
                     self.crawl_btn.config(text="🕸️ 一键爬取像源", state=tk.NORMAL)
@@ -255,6 +356,10 @@ class DockerMirrorTester:
         except Exception:
             return False
     
+    def _parse_mirrors(self, content):
+        """解析每行一个的镜像源列表"""
+        return [line.strip() for line in content.split('\n') if line.strip() and not line.startswith('#')]
+
     def start_test(self):
         """开始测试"""
         if self.is_testing:
@@ -265,7 +370,7 @@ class DockerMirrorTester:
             messagebox.showwarning("警告", "请输入或导入镜像源")
             return
         
-        mirrors = [line.strip() for line in content.split('\n') if line.strip() and not line.startswith('#')]
+        mirrors = self._parse_mirrors(content)
         
         if not mirrors:
             messagebox.showwarning("警告", "未找到有效的镜像源")
@@ -281,62 +386,316 @@ class DockerMirrorTester:
         self.copy_btn.config(state=tk.DISABLED)
         try:
             self.copy_pull_btn.config(state=tk.DISABLED)
+            self.bench_btn.config(state=tk.DISABLED)
+            self.download_btn.config(state=tk.DISABLED)
+            self.estimate_btn.config(state=tk.DISABLED)
+            self.load_btn.config(state=tk.DISABLED)
         except Exception:
             pass
         
         self.results = []
+        self.phases = {}
+        self.bench = {}
+        self.estimates = {}
+        self.load = {}
         self.tree.delete(*self.tree.get_children())
-        self.status_label.config(text=f"开始测试 {len(mirrors)} 个镜像源...")
+        self.full_retest = self.full_retest_var.get()
+        self.race_k = 3 if self.race_var.get() else 0
+        try:
+            self.deadline = float(self.deadline_entry.get().strip()) or None
+        except ValueError:
+            self.deadline = None
+        due, cached = self._split_due(mirrors)
+        self.results = list(cached)
+        for result in cached:
+            self.update_result(result, cached=True)
+        self.status_label.config(text=f"开始测试 {len(due)} 个镜像源（沿用 {len(cached)} 个未到复测时间的结果）...")
         
-        thread = threading.Thread(target=self.test_mirrors, args=(mirrors,))
+        thread = threading.Thread(target=self.test_mirrors, args=(due,))
         thread.daemon = True
         thread.start()
     
+    def _post(self, fn, *args):
+        """在界面线程执行回调；无界面模式下直接调用"""
+        if self.root is not None:
+            self.root.after(0, fn, *args)
+        else:
+            fn(*args)
+
+    def _emit(self, record):
+        """输出一行 JSON 结果"""
+        self.output.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self.output.flush()
+
+    def run_headless(self, mirrors):
+        """无界面模式：测试并以 JSON Lines 输出结果"""
+        self.results = []
+        self.phases = {}
+        self.bench = {}
+        due, cached = self._split_due(mirrors)
+        self.results = list(cached)
+        for result in cached:
+            self.update_result(result, cached=True)
+        self.test_mirrors(due)
+        return [r for r in self.results if r[4]]
+
+    def _split_due(self, mirrors):
+        """按历史记录拆分为 (需要复测的源, 沿用上次结果的源)；full_retest 时全部复测"""
+        if self.full_retest:
+            return list(mirrors), []
+        due = set(self.history.due(mirrors))
+        return [m for m in mirrors if m in due], self.history.last_results([m for m in mirrors if m not in due])
+
+    def show_history(self):
+        """启动时直接展示输入列表中各源的上次结果"""
+        mirrors = self._parse_mirrors(self.input_text.get('1.0', tk.END))
+        self.results = self.history.last_results(mirrors)
+        if not self.results:
+            return
+        for result in self._bench_ranking() + [r for r in self.results if not r[4]]:
+            self.update_result(result, cached=True)
+        working = [r for r in self.results if r[4]]
+        self._update_result_buttons()
+        age = (time.time() - self.history.last_tested(mirrors)) / 60
+        due = len(self.history.due(mirrors))
+        self.status_label.config(text=f"已载入 {age:.0f} 分钟前的结果：可用 {len(working)} 个，{due} 个源待复测")
+        self.tree.yview_moveto(0.0)
+
     def test_mirrors(self, mirrors):
-        """后台测试"""
-        total = len(mirrors)
-        for idx, mirror in enumerate(mirrors, 1):
-            progress = (idx / total) * 100
-            self.root.after(0, self.update_progress, progress, f"测试进度: {idx}/{total}")
-            
-            url = mirror.strip()
-            status_code, duration, error = self.test_mirror(url)
-            
-            if error:
-                result = (url, "❌ 失败", error, duration, False)
-            else:
-                if 200 <= status_code < 400:
-                    result = (url, "✅ 成功", f"{status_code}", duration, True)
-                else:
-                    result = (url, "⚠️ 异常", f"{status_code}", duration, False)
-            
-            self.results.append(result)
-            self.root.after(0, self.update_result, result)
-        
-        self.root.after(0, self.test_complete)
-    
-    def test_mirror(self, url):
-        """测试单个源"""
+        """后台并发测试，结果按完成顺序实时写入列表
+
+        竞速模式（race_k > 0）同时发起全部探测，一旦已有 race_k 个可用源、且所有在途探测的已耗时
+        都超过第 race_k 名的耗时（不可能再挤进前 race_k）即结束；deadline 为整体时限（秒）。
+        未完成的源记入 self.cancelled。每轮测试有独立的 _run_id，结束后递增，
+        被放弃的探测之后才返回时不再写入 self.phases。
+        """
+        urls = [mirror.strip() for mirror in mirrors]
+        total = len(urls)
+        done = [0]
+        fresh = []
+        lock = threading.Lock()
+        with self._latency_lock:
+            self._run_id += 1
+            self._sweep_latencies = []
+            self._sweep_total = total
+
+        def on_done(url, outcome):
+            result = self._make_result(url, *outcome)
+            self.history.record(result)
+            with lock:
+                self.results.append(result)
+                if result[4]:
+                    fresh.append(result[3])
+                done[0] += 1
+                idx = done[0]
+            self._post(self.update_progress, (idx / total) * 100, f"测试进度: {idx}/{total}")
+            self._post(self.update_result, result)
+
+        begin = time.perf_counter()
+
+        def stop(inflight, waiting):
+            now = time.perf_counter()
+            if self.deadline and now - begin >= self.deadline:
+                return True
+            if not self.race_k or waiting:
+                return False
+            with lock:
+                best = sorted(fresh)
+            if len(best) < self.race_k:
+                return False
+            return all(now - started >= best[self.race_k - 1] for started in inflight.values())
+
+        racing = self.race_k or self.deadline
+        workers = min(max(self.max_workers, total), 256) if self.race_k else None
+        self.cancelled = self._run_parallel(urls, self.test_mirror, on_done, workers, stop if racing else None)
+        with self._latency_lock:
+            self._run_id += 1
+        self._post(self.test_complete)
+
+    def _make_result(self, url, status_code, duration, error):
+        """将探测结果转换为 (url, 状态, 信息, 耗时, 是否可用)"""
+        if error:
+            return (url, "❌ 失败", error, duration, False)
+        if 200 <= status_code < 400:
+            return (url, "✅ 成功", f"{status_code}", duration, True)
+        return (url, "⚠️ 异常", f"{status_code}", duration, False)
+
+    def _host_of(self, url):
         try:
-            start_time = time.time()
-            response = requests.head(url, timeout=self.timeout, allow_redirects=True)
-            end_time = time.time()
-            return response.status_code, end_time - start_time, None
-        except requests.exceptions.Timeout:
-            return None, self.timeout, "超时"
-        except Exception as e:
-            return None, 0, f"错误: {e}"
+            return (urlparse(url).hostname or url).lower()
+        except Exception:
+            return url
+
+    def _run_parallel(self, urls, probe, on_done, workers=None, stop=None):
+        """有界并发调度：全局最多 workers（默认 max_workers）个、同一主机最多 per_host_limit 个请求在途
+
+        工作线程每次取出第一个所在主机仍有空位的任务，避免同主机任务占满线程而阻塞其他主机。
+        stop(在途任务的开始时间, 未派发任务数) 返回 True 时提前结束：不再派发新任务，
+        也不再等待在途任务，它们的结果被丢弃。on_done 在持有调度锁时调用，提前结束后
+        不会再有回调。返回未完成的任务列表。
+        """
+        pending = list(urls)
+        active = {}
+        inflight = {}
+        halted = [False]
+        cond = threading.Condition()
+        all_done = threading.Event()
+
+        def take():
+            with cond:
+                while pending and not halted[0]:
+                    for i, url in enumerate(pending):
+                        host = self._host_of(url)
+                        if active.get(host, 0) < self.per_host_limit:
+                            del pending[i]
+                            active[host] = active.get(host, 0) + 1
+                            inflight[url] = time.perf_counter()
+                            return url, host
+                    cond.wait()
+                return None, None
+
+        def worker():
+            try:
+                while True:
+                    url, host = take()
+                    if url is None:
+                        return
+                    try:
+                        outcome = probe(url)
+                    except Exception as e:
+                        outcome = (None, 0, f"错误: {e}")
+                    with cond:
+                        active[host] -= 1
+                        del inflight[url]
+                        cond.notify_all()
+                        if halted[0]:
+                            return
+                        on_done(url, outcome)
+            finally:
+                with cond:
+                    running[0] -= 1
+                    if running[0] == 0:
+                        all_done.set()
+
+        threads = [threading.Thread(target=worker, daemon=True) for _ in range(min(workers or self.max_workers, len(pending)))]
+        running = [len(threads)]
+        if not threads:
+            return []
+        for t in threads:
+            t.start()
+        while not all_done.wait(0.05):
+            if stop is None:
+                continue
+            with cond:
+                started = dict(inflight)
+                waiting = len(pending)
+            if stop(started, waiting):
+                with cond:
+                    halted[0] = True
+                    left = list(inflight) + pending
+                    cond.notify_all()
+                return left
+        return []
+
+    def _quantile(self, values, q):
+        ordered = sorted(values)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+    def _adaptive_timeout(self, url, sweep=None):
+        """按本轮已完成探测的耗时分布与该源的历史耗时推算 (超时, 对冲等待)
+
+        基准取本轮 p90 与该源近期最大耗时中的较大者：超时为基准的 timeout_factor 倍，
+        限制在 [timeout_floor, timeout]；对冲等待为基准的 hedge_factor 倍，不超过超时的一半。
+        本轮样本含超时与失败的探测（按已耗时计入，只会偏大），并行时最先完成的总是最快的源，
+        因此本轮完成数不足 adaptive_share 时只参考历史；两者都没有时使用固定超时。
+        sweep 为 (样本列表, 总数)，默认取 test_mirrors 当前这一轮的。
+        """
+        with self._latency_lock:
+            samples, total = sweep or (self._sweep_latencies, self._sweep_total)
+            samples = list(samples)
+        basis = []
+        if len(samples) >= max(5, total * self.adaptive_share):
+            basis.append(self._quantile(samples, 0.9))
+        history = self.history.recent_durations(url)
+        if history:
+            basis.append(max(history))
+        if not basis:
+            return self.timeout, self.timeout / 2
+        base = max(basis)
+        timeout = min(self.timeout, max(self.timeout_floor, base * self.timeout_factor))
+        return timeout, min(timeout / 2, max(self.timeout_floor / 2, base * self.hedge_factor))
+
+    def test_mirror(self, url, sweep=None):
+        """测试单个源（分阶段计时，耗时为冷启动总耗时）
+
+        超过对冲等待仍未返回时用新连接再发一次，取先成功的结果；两次都失败才判定失败，
+        避免把偶尔卡顿的源误判为不可用。两次尝试共用同一个截止时间，总耗时不超过超时；
+        对冲成功时耗时记为从首次发出到拿到结果的总时间，卡顿仍计入排名。
+        自适应超时内未返回时再按固定超时 self.timeout 测一次，仍超时才判定为超时。
+        传入 sweep（见 _adaptive_timeout）时耗时只记入该样本列表，不写入本轮测试的数据与 self.phases。
+        """
+        run = self._run_id
+        timeout, hedge_after = self._adaptive_timeout(url, sweep)
+        ok, value, duration = self._hedged_probe(url, timeout, hedge_after)
+        if not ok and self._timed_out(value) and timeout < self.timeout:
+            timeout = self.timeout
+            ok, value, retry = self._hedged_probe(url, timeout, timeout / 2)
+            duration = retry if ok else duration + retry
+        with self._latency_lock:
+            if sweep is not None:
+                sweep[0].append(duration)
+            elif run == self._run_id:
+                self._sweep_latencies.append(duration)
+                if ok:
+                    self.phases[url] = value[1]
+        if not ok:
+            if self._timed_out(value):
+                return None, timeout, "超时"
+            return None, 0, f"错误: {value}"
+        return value[0], duration, None
+
+    def _tree_values(self, result):
+        """结果树一行的显示值"""
+        url, status, msg, duration, success = result
+        phases = self.phases.get(url)
+        stages = "-"
+        warm = "-"
+        pull = "-"
+        if phases:
+            if phases['tcp'] is None:
+                stages = f"经代理 首字节{phases['ttfb']*1000:.0f}ms"
+            else:
+                stages = "/".join(f"{phases[k]*1000:.0f}" for k in ('dns', 'tcp', 'tls', 'ttfb')) + "ms"
+            if phases['warm'] is not None:
+                label = {'backend': ' 后端为主', 'network': ' 链路为主', None: ''}[self._diagnose(phases)]
+                warm = f"{phases['warm']*1000:.0f}ms{label}"
+        stats = self.bench.get(url)
+        if stats:
+            pull = f"{stats['rate'] / 1048576:.1f}MB/s 预计{stats['projected']:.0f}s" if stats['ok'] else "失败"
+        return (status, f"{duration:.3f}s", stages, warm, pull, url)
     
     def update_progress(self, value, text):
         """更新进度"""
+        if self.root is None:
+            return
         self.progress_var.set(value)
         self.status_label.config(text=text)
     
-    def update_result(self, result):
-        """更新结果树"""
+    def update_result(self, result, cached=False):
+        """更新结果树；cached 表示沿用历史记录、本次未复测"""
         url, status, msg, duration, success = result
+        if self.root is None:
+            record = {'type': 'result', 'url': url, 'ok': success, 'detail': msg, 'duration': round(duration, 4)}
+            if cached:
+                record['cached'] = True
+            phases = self.phases.get(url)
+            if phases:
+                record['phases'] = {k: (round(v, 4) if isinstance(v, float) else v) for k, v in phases.items()}
+                record['bottleneck'] = self._diagnose(phases)
+            self._emit(record)
+            return
         tag = 'success' if success else 'failed'
-        self.tree.insert('', 'end', values=(status, f"{duration:.3f}s", url), tags=(tag,))
+        self.tree.insert('', 'end', values=self._tree_values(result), tags=(tag,))
         
         if not hasattr(self, 'tree_style'):
             self.tree.tag_configure('success', foreground='#006400', background='#F0FFF0')
@@ -346,6 +705,13 @@ class DockerMirrorTester:
     def test_complete(self):
         """测试完成"""
         self.is_testing = False
+        if self.root is None:
+            working = sorted((r for r in self.results if r[4]), key=lambda x: x[3])
+            record = {'type': 'summary', 'ranking': [r[0] for r in working]}
+            if self.cancelled:
+                record['cancelled'] = self.cancelled
+            self._emit(record)
+            return
         self.test_btn.config(text="🚀 开始测试", state=tk.NORMAL)
         self.load_default_btn.config(state=tk.NORMAL)
         self.import_btn.config(state=tk.NORMAL)
@@ -353,14 +719,7 @@ class DockerMirrorTester:
         
         working = [r for r in self.results if r[4]]
         failed = [r for r in self.results if not r[4]]
-        
-        self.delete_btn.config(state=tk.NORMAL if failed else tk.DISABLED)
-        self.save_clean_btn.config(state=tk.NORMAL if working else tk.DISABLED)
-        self.copy_btn.config(state=tk.NORMAL if working else tk.DISABLED)
-        try:
-            self.copy_pull_btn.config(state=tk.NORMAL if working else tk.DISABLED)
-        except Exception:
-            pass
+        self._update_result_buttons()
         
         try:
             ts = time.strftime('%Y%m%d_%H%M%S')
@@ -370,17 +729,38 @@ class DockerMirrorTester:
                 f.write("=" * 60 + "\n\n")
                 f.write(f"测试时间: {time.strftime('%Y-%m-%d %H:%M:%S')}\n\n")
                 f.write(f"✅ 可用镜像源 ({len(working)} 个):\n")
-                for url, _, _, duration, _ in sorted(working, key=lambda x: x[3]):
-                    f.write(f"   {duration:.3f}s  {url}\n")
+                for r in sorted(working, key=lambda x: x[3]):
+                    _, _, stages, warm, _, url = self._tree_values(r)
+                    f.write(f"   {r[3]:.3f}s  {url}  [DNS/TCP/TLS/首字节 {stages} | 复用 {warm}]\n")
                 f.write("\n❌ 不可用镜像源:\n")
                 for url, _, msg, duration, _ in failed:
                     f.write(f"   {duration:.3f}s  {url}  -> {msg}\n")
         except Exception:
             pass
         
-        self.status_label.config(text=f"✅ 可用: {len(working)} 个 | ❌ 不可用: {len(failed)} 个")
+        text = f"✅ 可用: {len(working)} 个 | ❌ 不可用: {len(failed)} 个"
+        if self.cancelled:
+            text += f" | ⏹️ 竞速提前结束，{len(self.cancelled)} 个未完成"
+        self.status_label.config(text=text)
         self.tree.yview_moveto(0.0)
 
+    def _update_result_buttons(self):
+        """按当前结果启用/禁用结果相关按钮"""
+        working = [r for r in self.results if r[4]]
+        failed = [r for r in self.results if not r[4]]
+        self.delete_btn.config(state=tk.NORMAL if failed else tk.DISABLED)
+        self.save_clean_btn.config(state=tk.NORMAL if working else tk.DISABLED)
+        self.copy_btn.config(state=tk.NORMAL if working else tk.DISABLED)
+        try:
+            self.copy_pull_btn.config(state=tk.NORMAL if working else tk.DISABLED)
+            self.bench_btn.config(state=tk.NORMAL if working else tk.DISABLED)
+            self.download_btn.config(state=tk.NORMAL if working else tk.DISABLED)
+            self.estimate_btn.config(state=tk.NORMAL if working else tk.DISABLED)
+            self.load_btn.config(state=tk.NORMAL if working else tk.DISABLED)
+            self.proxy_btn.config(state=tk.NORMAL if working or self.proxy else tk.DISABLED)
+        except Exception:
+            pass
+
     def open_archive_dir(self):
         try:
             os.makedirs(self.archive_dir, exist_ok=True)
@@ -416,7 +796,7 @@ class DockerMirrorTester:
         self.tree.delete(*self.tree.get_children())
         for result in working:
             url, status, msg, duration, _ = result
-            self.tree.insert('', 'end', values=(status, f"{duration:.3f}s", url), tags=('success',))
+            self.tree.insert('', 'end', values=self._tree_values(result), tags=('success',))
         
         # 更新输入框（自动清理）
         self.input_text.delete('1.0', tk.END)
@@ -494,23 +874,37 @@ class DockerMirrorTester:
             messagebox.showerror("错误", f"复制失败: {e}")
     
     def copy_pull_cmd(self):
+        """复制拉取命令：每个镜像选用预估最快的源，未预估时用排名第一的源"""
         try:
-            img = self.image_entry.get().strip()
-            if not img:
+            images = self._entry_images()
+            if not images:
                 messagebox.showwarning("提示", "请输入镜像名，例如 ubuntu:latest 或 library/ubuntu")
                 return
-            working = [r for r in self.results if r[4]]
-            if not working:
+            ranking = self._bench_ranking()
+            if not ranking:
                 messagebox.showwarning("提示", "请先测试以获得可用镜像源")
                 return
-            domain = working[0][0].rstrip('/')
-            normalized = self._normalize_image_name(img)
-            cmd = f"docker pull {domain}/{normalized}"
-            pyperclip.copy(cmd)
+            cmds = []
+            for img in images:
+                mirror = self._best_mirror(img) or ranking[0][0]
+                parts = urlparse(mirror)
+                domain = (parts.netloc + parts.path).rstrip('/')
+                cmds.append(f"docker pull {domain}/{self._normalize_image_name(img)}")
+            pyperclip.copy("\n".join(cmds))
             messagebox.showinfo("成功", "加速拉取命令已复制到剪贴板！")
         except Exception as e:
             messagebox.showerror("错误", f"复制失败: {e}")
 
+    def _entry_images(self):
+        """镜像名输入框中的镜像列表（空格或逗号分隔）"""
+        return [n for n in re.split(r'[\s,]+', self.image_entry.get()) if n.strip('`')]
+
+    def _best_mirror(self, image):
+        for url, stats in self.estimates.get(image, []):
+            if stats['ok']:
+                return url
+        return None
+
     def _normalize_image_name(self, name):
         n = name.strip().strip('`').strip()
         if not n:
@@ -524,7 +918,863 @@ class DockerMirrorTester:
         if ':' not in n:
             n = n + ":latest"
         return n
+
+    def _split_image(self, name):
+        """规范化镜像名并拆分为 (仓库, 标签或摘要)"""
+        n = self._normalize_image_name(name)
+        if '@' in n:
+            return n.split('@', 1)
+        return n.rsplit(':', 1)
+
+    def _registry_session(self):
+        session = requests.Session()
+        session.headers['User-Agent'] = "Mozilla/5.0 DockerMirrorTester"
+        return session
+
+    def _parse_challenge(self, header):
+        """解析 WWW-Authenticate 中的 Bearer 质询参数（realm/service/scope）"""
+        scheme, _, params = header.partition(' ')
+        if scheme.lower() != 'bearer':
+            return None
+        return dict(re.findall(r'(\w+)="([^"]*)"', params))
+
+    def _bearer_token(self, session, challenge, scope):
+        """向质询中的 realm 换取令牌，按 (realm, service, scope) 缓存至过期前"""
+        realm = challenge.get('realm')
+        if not realm:
+            return None
+        service = challenge.get('service')
+        scope = challenge.get('scope') or scope
+        key = (realm, service, scope)
+        with self._token_lock:
+            cached = self._tokens.get(key)
+            if cached and cached[1] > time.time():
+                return cached[0]
+        params = {k: v for k, v in (('service', service), ('scope', scope)) if v}
+        r = session.get(realm, params=params, timeout=self.timeout)
+        r.raise_for_status()
+        data = r.json()
+        token = data.get('token') or data.get('access_token')
+        expires = data.get('expires_in', 60)
+        with self._token_lock:
+            self._tokens[key] = (token, time.time() + max(0, expires - 10))
+        return token
+
+    def _registry_get(self, session, mirror, path, scope=None, headers=None, stream=False, method='GET'):
+        """访问 registry v2 接口，遇到 401 时按 Bearer 质询换取令牌后重试一次
+
+        每个源的质询会被记住，之后的请求直接携带缓存的令牌，省去一次 401 往返。
+        返回 (响应, 换取令牌耗时)。
+        """
+        url = mirror.rstrip('/') + path
+        headers = dict(headers or {})
+        token_time = 0.0
+        challenge = self._challenges.get(mirror)
+        if challenge:
+            t = time.perf_counter()
+            token = self._bearer_token(session, challenge, scope)
+            token_time = time.perf_counter() - t
+            if token:
+                headers['Authorization'] = f"Bearer {token}"
+        r = session.request(method, url, headers=headers, timeout=self.timeout, stream=stream)
+        if r.status_code == 401:
+            challenge = self._parse_challenge(r.headers.get('WWW-Authenticate', ''))
+            if challenge:
+                self._challenges[mirror] = challenge
+                t = time.perf_counter()
+                token = self._bearer_token(session, challenge, scope)
+                token_time += time.perf_counter() - t
+                if token:
+                    r.close()
+                    headers['Authorization'] = f"Bearer {token}"
+                    r = session.request(method, url, headers=headers, timeout=self.timeout, stream=stream)
+        return r, token_time
+
+    def _fetch_manifest(self, session, mirror, repo, ref):
+        """获取镜像清单；多架构索引按 self.platform 选取对应平台的清单
+
+        返回 (清单, 换取令牌耗时, 清单原始字节)。按摘要引用的清单与索引中选中的平台清单
+        会校验原始字节的 sha256。
+        """
+        scope = f"repository:{repo}:pull"
+        r, token_time = self._registry_get(session, mirror, f"/v2/{repo}/manifests/{ref}", scope, {'Accept': MANIFEST_ACCEPT})
+        r.raise_for_status()
+        raw = r.content
+        if ref.startswith("sha256:"):
+            self._check_manifest_digest(raw, ref)
+        manifest = json.loads(raw)
+        if 'manifests' in manifest:
+            os_name, arch = self.platform
+            chosen = None
+            for entry in manifest['manifests']:
+                platform = entry.get('platform', {})
+                if platform.get('os') == os_name and platform.get('architecture') == arch:
+                    chosen = entry
+                    break
+            if chosen is None:
+                raise ValueError(f"清单中没有 {os_name}/{arch} 平台")
+            r, extra = self._registry_get(session, mirror, f"/v2/{repo}/manifests/{chosen['digest']}", scope, {'Accept': MANIFEST_ACCEPT})
+            token_time += extra
+            r.raise_for_status()
+            raw = r.content
+            self._check_manifest_digest(raw, chosen['digest'])
+            manifest = json.loads(raw)
+        return manifest, token_time, raw
+
+    def _check_manifest_digest(self, raw, digest):
+        """清单原始字节的 sha256 与引用的摘要不一致时抛出 ValueError"""
+        if f"sha256:{hashlib.sha256(raw).hexdigest()}" != digest:
+            raise ValueError(f"清单摘要校验失败: {digest}")
+
+    def _ranged_blob(self, session, mirror, repo, layer):
+        """区间下载层 blob 的前 bench_bytes 字节（最长 bench_seconds 秒）
+
+        返回 (首字节耗时, 接收字节数, 持续速率 B/s)。速率从首个数据块之后开始计算，
+        不含建连与首字节等待。服务端忽略 Range 返回整个 blob 时同样在上限处截断。
+        """
+        limit = min(self.bench_bytes, layer.get('size') or self.bench_bytes)
+        headers = {'Range': f"bytes=0-{limit - 1}"}
+        start = time.perf_counter()
+        r, _ = self._registry_get(session, mirror, f"/v2/{repo}/blobs/{layer['digest']}", f"repository:{repo}:pull", headers, stream=True)
+        first = None
+        first_len = 0
+        received = 0
+        try:
+            r.raise_for_status()
+            for chunk in r.iter_content(65536):
+                now = time.perf_counter()
+                if first is None:
+                    first, first_len = now, len(chunk)
+                received += len(chunk)
+                if received >= limit or now - first >= self.bench_seconds:
+                    break
+            end = time.perf_counter()
+        finally:
+            r.close()
+        if first is None:
+            raise ValueError("blob 响应为空")
+        body = received - first_len
+        if body and end > first:
+            rate = body / (end - first)
+        else:
+            rate = received / (end - start)
+        return first - start, received, rate
+
+    def _project_pull_time(self, stats):
+        """预计拉取耗时：令牌与清单 + 每批并发层的首字节等待 + 镜像总大小按实测速率传输
+
+        Docker 默认同时下载 3 个层（pull_concurrency），实测速率来自单连接，结果偏保守。
+        """
+        batches = -(-stats['layers'] // self.pull_concurrency)
+        return stats['token'] + stats['manifest'] + batches * stats['ttfb'] + stats['size'] / stats['rate']
+
+    def _bench_mirror(self, url, repo, ref, slot):
+        """registry v2 拉取测速：/v2/ 探活、令牌、清单、最大层 blob 的区间下载
+
+        slot 限制同时进行的 blob 下载数，避免多个源争抢本机带宽导致速率失真。
+        """
+        stats = {'ok': False}
+        session = self._registry_session()
+        try:
+            t = time.perf_counter()
+            r = session.get(url.rstrip('/') + '/v2/', timeout=self.timeout)
+            r.close()
+            stats['ping'] = time.perf_counter() - t
+            if r.status_code not in (200, 401):
+                raise ValueError(f"/v2/ 返回 {r.status_code}")
+            challenge = self._parse_challenge(r.headers.get('WWW-Authenticate', ''))
+            if challenge:
+                self._challenges[url] = challenge
+            t = time.perf_counter()
+            manifest, token_time, _ = self._fetch_manifest(session, url, repo, ref)
+            stats['token'] = token_time
+            stats['manifest'] = time.perf_counter() - t - token_time
+            layers = manifest.get('layers') or []
+            if not layers:
+                raise ValueError("清单中没有镜像层")
+            stats['layers'] = len(layers)
+            stats['size'] = sum(layer.get('size', 0) for layer in layers)
+            with slot:
+                ttfb, received, rate = self._ranged_blob(session, url, repo, max(layers, key=lambda layer: layer.get('size', 0)))
+            stats.update(ttfb=ttfb, bytes=received, rate=rate)
+            stats['projected'] = self._project_pull_time(stats)
+            stats['ok'] = True
+        except requests.Timeout:
+            stats['error'] = "超时"
+        except Exception as e:
+            stats['error'] = f"错误: {e}"
+        finally:
+            session.close()
+        return stats
+
+    def _bench_ranking(self, results=None):
+        """可用源排序：有拉取测速结果的按预计拉取耗时在前，其余按响应时间在后"""
+        def key(r):
+            stats = self.bench.get(r[0])
+            if stats and stats['ok']:
+                return (0, stats['projected'])
+            return (1, r[3])
+        if results is None:
+            results = self.results
+        return sorted((r for r in results if r[4]), key=key)
+
+    def rank_mirrors(self, urls):
+        """静默复测一组镜像源（不更新界面），返回排序后的可用源地址
+
+        使用独立的耗时样本推算超时，不影响同时进行的界面测试。
+        """
+        results = []
+        sweep = ([], len(urls))
+        lock = threading.Lock()
+
+        def on_done(url, outcome):
+            result = self._make_result(url, *outcome)
+            self.history.record(result)
+            with lock:
+                results.append(result)
+
+        self._run_parallel(urls, lambda url: self.test_mirror(url, sweep), on_done)
+        return [r[0] for r in self._bench_ranking(results)]
+
+    def toggle_proxy(self):
+        if self.proxy is not None:
+            self.proxy.stop()
+            self.proxy = None
+            self.proxy_btn.config(text="🛰️ 启动本地代理")
+            self.status_label.config(text="本地代理已停止")
+            return
+        ranking = [r[0] for r in self._bench_ranking()]
+        if not ranking:
+            return
+        proxy = RegistryProxy(self, [r[0] for r in self.results], port=self.proxy_port,
+                              cache_dir=self.proxy_cache_dir, cache_limit=self.proxy_cache_limit)
+        try:
+            proxy.start(ranking)
+        except Exception as e:
+            messagebox.showerror("错误", f"无法启动本地代理: {e}")
+            return
+        self.proxy = proxy
+        self.proxy_btn.config(text="⏹️ 停止本地代理")
+        self.status_label.config(text=f"✅ 本地代理已启动 http://127.0.0.1:{self.proxy_port} → {ranking[0]}")
+        self.usage_label.config(text=(
+            "本地代理使用说明：\n"
+            f"daemon.json 中设置 \"registry-mirrors\": [\"http://127.0.0.1:{self.proxy_port}\"] 并重启 Docker；\n"
+            "代理自动选用当前最快的镜像源，失败时切换到下一个，已下载的层缓存在本地磁盘。"
+        ))
+
+    def start_benchmark(self):
+        """对可用镜像源执行拉取测速"""
+        if self.is_testing:
+            return
+        images = self._entry_images()
+        if not images:
+            messagebox.showwarning("提示", "请输入镜像名，例如 ubuntu:latest 或 library/ubuntu")
+            return
+        image = images[0]
+        urls = [r[0] for r in self.results if r[4]]
+        if not urls:
+            messagebox.showwarning("提示", "请先测试以获得可用镜像源")
+            return
+        self.is_testing = True
+        self.bench_btn.config(state=tk.DISABLED)
+        self.test_btn.config(state=tk.DISABLED)
+        self.status_label.config(text=f"开始拉取测速 {image}（{len(urls)} 个镜像源）...")
+        thread = threading.Thread(target=self.benchmark_mirrors, args=(urls, image))
+        thread.daemon = True
+        thread.start()
+
+    def benchmark_mirrors(self, urls, image):
+        """后台并发执行拉取测速，blob 下载按 bench_parallel 限流"""
+        repo, ref = self._split_image(image)
+        slot = threading.BoundedSemaphore(self.bench_parallel)
+        total = len(urls)
+        done = [0]
+        lock = threading.Lock()
+
+        def on_done(url, stats):
+            with lock:
+                self.bench[url] = stats
+                done[0] += 1
+                idx = done[0]
+            self._post(self.update_progress, (idx / total) * 100, f"拉取测速进度: {idx}/{total}")
+            self._post(self.update_bench, url, stats)
+
+        self._run_parallel(urls, lambda url: self._bench_mirror(url, repo, ref, slot), on_done)
+        self._post(self.bench_complete, image)
+
+    def update_bench(self, url, stats):
+        """输出单个源的拉取测速结果"""
+        if self.root is None:
+            record = {'type': 'bench', 'url': url}
+            record.update({k: (round(v, 4) if isinstance(v, float) else v) for k, v in stats.items()})
+            self._emit(record)
+
+    def bench_complete(self, image):
+        """拉取测速完成：按预计拉取耗时重排结果"""
+        self.is_testing = False
+        ranking = [r for r in self._bench_ranking() if self.bench.get(r[0], {}).get('ok')]
+        if self.root is None:
+            self._emit({'type': 'bench_summary', 'image': image, 'ranking': [r[0] for r in ranking]})
+            return
+        self.bench_btn.config(state=tk.NORMAL)
+        self.test_btn.config(state=tk.NORMAL)
+
+        self.tree.delete(*self.tree.get_children())
+        for result in self._bench_ranking() + [r for r in self.results if not r[4]]:
+            tag = 'success' if result[4] else 'failed'
+            self.tree.insert('', 'end', values=self._tree_values(result), tags=(tag,))
+
+        try:
+            ts = time.strftime('%Y%m%d_%H%M%S')
+            log_path = os.path.join(self.archive_dir, f"pull_bench_{ts}.txt")
+            with open(log_path, 'w', encoding='utf-8') as f:
+                f.write(f"Docker 镜像源拉取测速: {image}\n")
+                f.write("=" * 60 + "\n\n")
+                for url, _, _, _, _ in ranking:
+                    stats = self.bench[url]
+                    f.write(f"   预计 {stats['projected']:.1f}s  {stats['rate'] / 1048576:.2f}MB/s  首字节 {stats['ttfb']*1000:.0f}ms  {url}\n")
+                f.write("\n❌ 测速失败:\n")
+                for url, stats in self.bench.items():
+                    if not stats['ok']:
+                        f.write(f"   {url}  -> {stats.get('error')}\n")
+        except Exception:
+            pass
+
+        self.status_label.config(text=f"✅ 拉取测速完成: {len(ranking)}/{len(self.bench)} 个镜像源可拉取 {image}")
+        self.tree.yview_moveto(0.0)
     
+    def _load_repo_index(self):
+        """源 → 仓库可用性索引：{源: {仓库: [是否提供, 检查时间]}}，持久化在 repo_index.json"""
+        if self.repo_index is None:
+            try:
+                with open(self.repo_index_file, 'r', encoding='utf-8') as f:
+                    self.repo_index = json.load(f)
+            except (OSError, ValueError):
+                self.repo_index = {}
+        return self.repo_index
+
+    def _save_repo_index(self):
+        try:
+            with open(self.repo_index_file, 'w', encoding='utf-8') as f:
+                json.dump(self.repo_index, f, ensure_ascii=False)
+        except OSError:
+            pass
+
+    def _estimate_mirror(self, url, images):
+        """在同一会话中逐个获取镜像清单，结合该源的吞吐测速得出各镜像的预计拉取耗时
+
+        清单返回 404 的仓库记入索引，repo_index_ttl 内不再向该源请求。
+        """
+        index = self.repo_index.setdefault(url, {})
+        bench = self.bench.get(url) or {}
+        now = time.time()
+        out = {}
+        session = self._registry_session()
+        try:
+            for image in images:
+                repo, ref = self._split_image(image)
+                known = index.get(repo)
+                if known and not known[0] and now - known[1] < self.repo_index_ttl:
+                    out[image] = {'ok': False, 'available': False, 'error': "索引记录该源未提供此仓库"}
+                    continue
+                t = time.perf_counter()
+                try:
+                    manifest, token_time, _ = self._fetch_manifest(session, url, repo, ref)
+                except requests.HTTPError as e:
+                    missing = e.response is not None and e.response.status_code == 404
+                    if missing:
+                        index[repo] = [False, now]
+                    out[image] = {'ok': False, 'available': not missing, 'error': f"错误: {e}"}
+                    continue
+                except requests.Timeout:
+                    out[image] = {'ok': False, 'available': None, 'error': "超时"}
+                    continue
+                except Exception as e:
+                    out[image] = {'ok': False, 'available': None, 'error': f"错误: {e}"}
+                    continue
+                index[repo] = [True, now]
+                layers = manifest.get('layers') or []
+                stats = {'ok': False, 'available': True, 'token': token_time,
+                         'manifest': time.perf_counter() - t - token_time,
+                         'layers': len(layers), 'size': sum(layer.get('size', 0) for layer in layers)}
+                if bench.get('ok'):
+                    stats.update(ttfb=bench['ttfb'], rate=bench['rate'], ok=True)
+                    stats['projected'] = self._project_pull_time(stats)
+                else:
+                    stats['error'] = "缺少吞吐测速数据"
+                out[image] = stats
+        finally:
+            session.close()
+        return out
+
+    def estimate_pulls(self, images, urls):
+        """预估每个 (镜像, 源) 的拉取耗时
+
+        尚无吞吐数据的源先用第一个镜像做一次拉取测速。返回并保存到 self.estimates：
+        {镜像: [(源, 统计), ...]}，按预计耗时排序，不可用的源排在最后。
+        """
+        self._load_repo_index()
+        missing = [url for url in urls if not self.bench.get(url, {}).get('ok')]
+        if missing:
+            repo, ref = self._split_image(images[0])
+            slot = threading.BoundedSemaphore(self.bench_parallel)
+            self._run_parallel(missing, lambda url: self._bench_mirror(url, repo, ref, slot),
+                               lambda url, stats: self.bench.__setitem__(url, stats))
+        per_mirror = {}
+        self._run_parallel(urls, lambda url: self._estimate_mirror(url, images),
+                           lambda url, out: per_mirror.__setitem__(url, out))
+        self._save_repo_index()
+        estimates = {}
+        for image in images:
+            rows = [(url, per_mirror[url][image]) for url in urls if image in per_mirror.get(url, {})]
+            rows.sort(key=lambda row: (0, row[1]['projected']) if row[1]['ok'] else (1, 0))
+            estimates[image] = rows
+        self.estimates = estimates
+        return estimates
+
+    def start_estimate(self):
+        """预估输入框中每个镜像在各可用源上的拉取耗时"""
+        if self.is_testing:
+            return
+        images = self._entry_images()
+        if not images:
+            messagebox.showwarning("提示", "请输入镜像名，多个镜像用空格或逗号分隔")
+            return
+        urls = [r[0] for r in self.results if r[4]]
+        if not urls:
+            messagebox.showwarning("提示", "请先测试以获得可用镜像源")
+            return
+        self.is_testing = True
+        self.estimate_btn.config(state=tk.DISABLED)
+        self.test_btn.config(state=tk.DISABLED)
+        self.status_label.config(text=f"正在预估 {len(images)} 个镜像在 {len(urls)} 个镜像源上的拉取耗时...")
+        thread = threading.Thread(target=self._estimate_worker, args=(images, urls))
+        thread.daemon = True
+        thread.start()
+
+    def _estimate_worker(self, images, urls):
+        try:
+            estimates, error = self.estimate_pulls(images, urls), None
+        except Exception as e:
+            estimates, error = None, str(e)
+        self._post(self.estimate_complete, estimates, error)
+
+    def estimate_complete(self, estimates, error):
+        """拉取耗时预估完成"""
+        self.is_testing = False
+        if self.root is None:
+            if error:
+                self._emit({'type': 'estimate', 'ok': False, 'detail': error})
+                return
+            for image, rows in estimates.items():
+                for url, stats in rows:
+                    record = {'type': 'estimate', 'image': image, 'url': url}
+                    record.update({k: (round(v, 4) if isinstance(v, float) else v) for k, v in stats.items()})
+                    self._emit(record)
+            self._emit({'type': 'estimate_summary', 'best': {image: self._best_mirror(image) for image in estimates}})
+            return
+        self.estimate_btn.config(state=tk.NORMAL)
+        self.test_btn.config(state=tk.NORMAL)
+        if error:
+            self.status_label.config(text=f"❌ 预估失败: {error}")
+            return
+        lines = []
+        for image, rows in estimates.items():
+            ok = [(url, stats) for url, stats in rows if stats['ok']]
+            if ok:
+                url, stats = ok[0]
+                lines.append(f"{image}: {url}  预计 {stats['projected']:.1f}s（{stats['size'] / 1048576:.1f}MB，{len(ok)}/{len(rows)} 个源可用）")
+            else:
+                lines.append(f"{image}: 没有可用的镜像源")
+        try:
+            ts = time.strftime('%Y%m%d_%H%M%S')
+            with open(os.path.join(self.archive_dir, f"pull_estimate_{ts}.txt"), 'w', encoding='utf-8') as f:
+                f.write("Docker 镜像拉取耗时预估\n")
+                f.write("=" * 60 + "\n\n")
+                for image, rows in estimates.items():
+                    f.write(f"{image}\n")
+                    for url, stats in rows:
+                        if stats['ok']:
+                            f.write(f"   预计 {stats['projected']:.1f}s  {stats['size'] / 1048576:.1f}MB  {url}\n")
+                        else:
+                            f.write(f"   -  {url}  -> {stats.get('error')}\n")
+                    f.write("\n")
+        except Exception:
+            pass
+        self.status_label.config(text=f"✅ 已预估 {len(estimates)} 个镜像，复制加速拉取命令将按镜像选用最快的源")
+        self.usage_label.config(text="拉取耗时预估：\n" + "\n".join(lines))
+
+    def _error_kind(self, e):
+        if isinstance(e, requests.Timeout):
+            return "超时"
+        if isinstance(e, requests.HTTPError) and e.response is not None:
+            return str(e.response.status_code)
+        if isinstance(e, requests.ConnectionError):
+            return "连接错误"
+        return type(e).__name__
+
+    def _load_level(self, url, repo, layer, level):
+        """同时发起 level 个区间下载（各自独立连接），返回该并发度下的聚合吞吐与错误统计"""
+        received = [0] * level
+        kinds = {}
+        lock = threading.Lock()
+
+        def stream(i):
+            session = self._registry_session()
+            try:
+                _, received[i], _ = self._ranged_blob(session, url, repo, layer)
+            except Exception as e:
+                kind = self._error_kind(e)
+                with lock:
+                    kinds[kind] = kinds.get(kind, 0) + 1
+            finally:
+                session.close()
+
+        threads = [threading.Thread(target=stream, args=(i,), daemon=True) for i in range(level)]
+        start = time.perf_counter()
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        wall = time.perf_counter() - start
+        errors = sum(kinds.values())
+        return {'level': level, 'bytes': sum(received), 'rate': sum(received) / wall if wall > 0 else 0.0,
+                'errors': errors, 'error_rate': errors / level, 'kinds': kinds}
+
+    def _load_profile(self, url, repo, ref, on_level=None):
+        """逐级提高并发度（load_levels）测量单个源的聚合吞吐曲线
+
+        某一级全部失败时停止加压。peak_level 为吞吐最高且无错误的并发度，
+        throttled 表示加压后出现错误或吞吐明显回落（低于峰值 80%）。
+        """
+        session = self._registry_session()
+        try:
+            manifest, _, _ = self._fetch_manifest(session, url, repo, ref)
+        finally:
+            session.close()
+        layers = manifest.get('layers') or []
+        if not layers:
+            raise ValueError("清单中没有镜像层")
+        layer = max(layers, key=lambda layer: layer.get('size', 0))
+        levels = []
+        for level in self.load_levels:
+            stats = self._load_level(url, repo, layer, level)
+            levels.append(stats)
+            if on_level:
+                on_level(stats)
+            if stats['errors'] == level:
+                break
+        clean = [s for s in levels if not s['errors']] or levels
+        peak = max(clean, key=lambda s: s['rate'])
+        last = levels[-1]
+        throttled = any(s['errors'] for s in levels) or last['rate'] < peak['rate'] * 0.8
+        return {'ok': True, 'levels': levels, 'peak_level': peak['level'], 'peak_rate': peak['rate'], 'throttled': throttled}
+
+    def _streams_for(self, url):
+        """多源下载时每个源的并发连接数：有并发曲线时取其峰值并发度（最多 8）"""
+        profile = self.load.get(url)
+        if profile and profile.get('ok'):
+            return max(1, min(profile['peak_level'], 8))
+        return self.download_streams
+
+    def load_profile_mirrors(self, urls, image):
+        """依次对每个源做并发曲线测试（各源之间串行，避免争抢本机带宽）"""
+        repo, ref = self._split_image(image)
+        steps = len(urls) * len(self.load_levels)
+        for i, url in enumerate(urls):
+            def on_level(stats, i=i, url=url):
+                step = i * len(self.load_levels) + self.load_levels.index(stats['level']) + 1
+                self._post(self.update_progress, step * 100 / steps,
+                           f"并发曲线: {self._host_of(url)} 并发 {stats['level']} → {stats['rate'] / 1048576:.1f}MB/s")
+            try:
+                profile = self._load_profile(url, repo, ref, on_level)
+            except Exception as e:
+                profile = {'ok': False, 'error': f"错误: {e}"}
+            self.load[url] = profile
+            self._post(self.update_load, url, profile)
+        self._post(self.load_complete, image)
+
+    def start_load_profile(self):
+        """对可用镜像源测量并发吞吐曲线"""
+        if self.is_testing:
+            return
+        images = self._entry_images()
+        if not images:
+            messagebox.showwarning("提示", "请输入镜像名，例如 ubuntu:latest 或 library/ubuntu")
+            return
+        urls = [r[0] for r in self._bench_ranking()]
+        if not urls:
+            messagebox.showwarning("提示", "请先测试以获得可用镜像源")
+            return
+        self.is_testing = True
+        self.load_btn.config(state=tk.DISABLED)
+        self.test_btn.config(state=tk.DISABLED)
+        self.status_label.config(text=f"开始并发曲线测试（{len(urls)} 个镜像源，并发 {'/'.join(map(str, self.load_levels))}）...")
+        thread = threading.Thread(target=self.load_profile_mirrors, args=(urls, images[0]))
+        thread.daemon = True
+        thread.start()
+
+    def _load_line(self, url, profile):
+        if not profile['ok']:
+            return f"{url}  -> {profile['error']}"
+        curve = "  ".join(f"{s['level']}:{s['rate'] / 1048576:.1f}" + (f"(错{s['errors']})" if s['errors'] else "")
+                          for s in profile['levels'])
+        flag = "  ⚠️限流" if profile['throttled'] else ""
+        return f"{url}  峰值并发 {profile['peak_level']}  {curve} MB/s{flag}"
+
+    def update_load(self, url, profile):
+        """输出单个源的并发曲线"""
+        if self.root is None:
+            record = {'type': 'load', 'url': url}
+            record.update(profile)
+            self._emit(self._round_floats(record))
+
+    def _round_floats(self, value):
+        if isinstance(value, float):
+            return round(value, 4)
+        if isinstance(value, dict):
+            return {k: self._round_floats(v) for k, v in value.items()}
+        if isinstance(value, list):
+            return [self._round_floats(v) for v in value]
+        return value
+
+    def load_complete(self, image):
+        """并发曲线测试完成"""
+        self.is_testing = False
+        if self.root is None:
+            return
+        self.load_btn.config(state=tk.NORMAL)
+        self.test_btn.config(state=tk.NORMAL)
+        lines = [self._load_line(url, profile) for url, profile in self.load.items()]
+        try:
+            ts = time.strftime('%Y%m%d_%H%M%S')
+            with open(os.path.join(self.archive_dir, f"load_profile_{ts}.txt"), 'w', encoding='utf-8') as f:
+                f.write(f"Docker 镜像源并发吞吐曲线: {image}\n")
+                f.write("=" * 60 + "\n\n")
+                f.write("并发度:吞吐(MB/s)，错N 表示该并发度下失败的请求数\n\n")
+                for line in lines:
+                    f.write(f"   {line}\n")
+        except Exception:
+            pass
+        steady = sum(1 for profile in self.load.values() if profile['ok'] and not profile['throttled'])
+        self.status_label.config(text=f"✅ 并发曲线完成: {steady}/{len(self.load)} 个镜像源在高并发下保持稳定")
+        self.usage_label.config(text="并发吞吐曲线（并发度:MB/s）：\n" + "\n".join(lines))
+
+    def _fetch_range(self, session, mirror, repo, digest, path, size, start, end):
+        """下载 blob 的 [start, end] 区间并写入目标文件对应偏移，返回写入字节数"""
+        headers = {'Range': f"bytes={start}-{end}", 'Accept-Encoding': 'identity'}
+        r, _ = self._registry_get(session, mirror, f"/v2/{repo}/blobs/{digest}", f"repository:{repo}:pull", headers, stream=True)
+        need = end - start + 1
+        written = 0
+        try:
+            r.raise_for_status()
+            if r.status_code != 206 and not (start == 0 and end == size - 1):
+                raise ValueError("源不支持 Range 请求")
+            with open(path, 'r+b') as f:
+                f.seek(start)
+                for chunk in r.iter_content(65536):
+                    chunk = chunk[:need - written]
+                    f.write(chunk)
+                    written += len(chunk)
+                    if written >= need:
+                        break
+        finally:
+            r.close()
+        if written != need:
+            raise ValueError("区间数据不完整")
+        return written
+
+    def _verify_blob(self, path, digest):
+        hasher = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                hasher.update(chunk)
+        return f"sha256:{hasher.hexdigest()}" == digest
+
+    def download_image(self, image, urls, dest):
+        """多源并行下载镜像，写出可直接 docker load 的 tar（同时是 OCI layout）
+
+        大于 chunk_size 的层按区间切片，所有切片放入共享队列，每个源开 download_streams 个线程领取，
+        快的源自然领取更多；失败的切片放回队列由其他源重试，同一个源的各线程累计连续失败 3 次后该源退出。
+        全部完成后逐个校验 sha256 摘要。返回下载统计。
+        """
+        repo, ref = self._split_image(image)
+        urls = list(urls)[:self.download_sources]
+        manifest = None
+        errors = []
+        for url in urls:
+            session = self._registry_session()
+            try:
+                manifest, _, raw = self._fetch_manifest(session, url, repo, ref)
+                break
+            except Exception as e:
+                errors.append(f"{url}: {e}")
+            finally:
+                session.close()
+        if manifest is None:
+            raise ValueError("无法获取清单: " + "; ".join(errors))
+        blobs = [manifest['config']] + list(manifest.get('layers') or [])
+        total_bytes = sum(blob['size'] for blob in blobs)
+
+        work = tempfile.mkdtemp(prefix="docker_pull_")
+        try:
+            blob_dir = os.path.join(work, "blobs", "sha256")
+            os.makedirs(blob_dir)
+            tasks = queue.Queue()
+            for blob in blobs:
+                path = os.path.join(blob_dir, blob['digest'].split(':', 1)[1])
+                with open(path, 'wb') as f:
+                    f.truncate(blob['size'])
+                for start in range(0, blob['size'], self.chunk_size):
+                    end = min(start + self.chunk_size, blob['size']) - 1
+                    tasks.put((blob['digest'], path, blob['size'], start, end))
+            total_units = tasks.qsize()
+            state = {'done': 0, 'bytes': 0}
+            per_mirror = dict.fromkeys(urls, 0)
+            failures = dict.fromkeys(urls, 0)
+            lock = threading.Lock()
+            started = time.perf_counter()
+
+            def worker(url):
+                session = self._registry_session()
+                try:
+                    while True:
+                        with lock:
+                            if state['done'] == total_units or failures[url] >= 3:
+                                return
+                        try:
+                            unit = tasks.get(timeout=0.2)
+                        except queue.Empty:
+                            continue
+                        try:
+                            n = self._fetch_range(session, url, repo, *unit)
+                        except Exception:
+                            with lock:
+                                failures[url] += 1
+                            tasks.put(unit)
+                            continue
+                        with lock:
+                            failures[url] = 0
+                            state['done'] += 1
+                            state['bytes'] += n
+                            per_mirror[url] += n
+                            received = state['bytes']
+                        self._post(self.update_progress, received * 100 / max(total_bytes, 1),
+                                   f"多源下载: {received / 1048576:.1f}/{total_bytes / 1048576:.1f} MB")
+                finally:
+                    session.close()
+
+            threads = [threading.Thread(target=worker, args=(url,), daemon=True)
+                       for url in urls for _ in range(self._streams_for(url))]
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+            if state['done'] != total_units:
+                raise ValueError(f"所有源均下载失败，剩余 {total_units - state['done']} 个分片")
+            elapsed = time.perf_counter() - started
+
+            for blob in blobs:
+                if not self._verify_blob(os.path.join(blob_dir, blob['digest'].split(':', 1)[1]), blob['digest']):
+                    raise ValueError(f"摘要校验失败: {blob['digest']}")
+            self._write_image_tar(work, dest, image, repo, ref, manifest, raw)
+        finally:
+            shutil.rmtree(work, ignore_errors=True)
+        return {'image': image, 'path': dest, 'bytes': total_bytes, 'seconds': elapsed,
+                'rate': total_bytes / elapsed if elapsed > 0 else 0.0, 'per_mirror': per_mirror}
+
+    def _write_image_tar(self, work, dest, image, repo, ref, manifest, data):
+        """按 docker save 的格式打包：OCI layout（oci-layout/index.json/blobs）加兼容旧版的 manifest.json
+
+        清单按源站返回的原始字节 data 写入，保证其摘要与仓库中的一致。
+        """
+        digest = hashlib.sha256(data).hexdigest()
+        with open(os.path.join(work, "blobs", "sha256", digest), 'wb') as f:
+            f.write(data)
+        name = repo[len("library/"):] if repo.startswith("library/") else repo
+        tags = [] if ref.startswith("sha256:") else [f"{name}:{ref}"]
+        descriptor = {
+            'mediaType': manifest.get('mediaType', "application/vnd.oci.image.manifest.v1+json"),
+            'digest': f"sha256:{digest}",
+            'size': len(data),
+        }
+        if tags:
+            descriptor['annotations'] = {
+                "io.containerd.image.name": f"docker.io/{repo}:{ref}",
+                "org.opencontainers.image.ref.name": ref,
+            }
+        index = {'schemaVersion': 2, 'mediaType': "application/vnd.oci.image.index.v1+json", 'manifests': [descriptor]}
+        legacy = [{
+            'Config': "blobs/sha256/" + manifest['config']['digest'].split(':', 1)[1],
+            'RepoTags': tags,
+            'Layers': ["blobs/sha256/" + layer['digest'].split(':', 1)[1] for layer in manifest.get('layers') or []],
+        }]
+        for filename, content in (("oci-layout", {'imageLayoutVersion': "1.0.0"}), ("index.json", index), ("manifest.json", legacy)):
+            with open(os.path.join(work, filename), 'w', encoding='utf-8') as f:
+                json.dump(content, f)
+        with tarfile.open(dest, 'w') as tar:
+            for filename in ("oci-layout", "index.json", "manifest.json", "blobs"):
+                tar.add(os.path.join(work, filename), arcname=filename)
+
+    def start_download(self):
+        """从多个可用源并行下载镜像并保存为 tar"""
+        if self.is_testing:
+            return
+        images = self._entry_images()
+        if not images:
+            messagebox.showwarning("提示", "请输入镜像名，例如 ubuntu:latest 或 library/ubuntu")
+            return
+        image = images[0]
+        urls = [r[0] for r in self._bench_ranking()]
+        if not urls:
+            messagebox.showwarning("提示", "请先测试以获得可用镜像源")
+            return
+        safe = re.sub(r'[^\w.-]+', '_', image)
+        dest = filedialog.asksaveasfilename(
+            title="保存镜像 tar",
+            defaultextension=".tar",
+            initialfile=f"{safe}.tar",
+            filetypes=[("tar 文件", "*.tar"), ("所有文件", "*.*")],
+            initialdir=self.archive_dir
+        )
+        if not dest:
+            return
+        self.is_testing = True
+        self.download_btn.config(state=tk.DISABLED)
+        self.test_btn.config(state=tk.DISABLED)
+        self.status_label.config(text=f"开始多源下载 {image}（{min(len(urls), self.download_sources)} 个镜像源）...")
+        thread = threading.Thread(target=self._download_worker, args=(image, urls, dest))
+        thread.daemon = True
+        thread.start()
+
+    def _download_worker(self, image, urls, dest):
+        try:
+            stats, error = self.download_image(image, urls, dest), None
+        except Exception as e:
+            stats, error = None, str(e)
+        self._post(self.download_complete, stats, error)
+
+    def download_complete(self, stats, error):
+        """多源下载完成"""
+        self.is_testing = False
+        if self.root is None:
+            if error:
+                self._emit({'type': 'download', 'ok': False, 'detail': error})
+            else:
+                record = {'type': 'download', 'ok': True}
+                record.update({k: (round(v, 4) if isinstance(v, float) else v) for k, v in stats.items()})
+                self._emit(record)
+            return
+        self.download_btn.config(state=tk.NORMAL)
+        self.test_btn.config(state=tk.NORMAL)
+        if error:
+            self.status_label.config(text=f"❌ 多源下载失败: {error}")
+            messagebox.showerror("错误", f"多源下载失败: {error}")
+            return
+        share = "，".join(f"{self._host_of(url)} {n / 1048576:.1f}MB" for url, n in stats['per_mirror'].items() if n)
+        self.status_label.config(text=f"✅ 已下载 {stats['bytes'] / 1048576:.1f}MB，用时 {stats['seconds']:.1f}s（{stats['rate'] / 1048576:.2f}MB/s）")
+        messagebox.showinfo("完成", f"镜像已保存到:\n{stats['path']}\n\n各源分担: {share}\n\n导入: docker load -i \"{stats['path']}\"")
+
     def save_results(self):
         """保存完整测试结果报告"""
         if not self.results:
@@ -560,10 +1810,349 @@ class DockerMirrorTester:
             except Exception as e:
                 messagebox.showerror("错误", f"保存失败: {e}")
 
+
+class MirrorHistory:
+    # 镜像源历史记录（SQLite）：probes 表保存每一次探测结果，mirrors 表保存每个源的最新状态与下次复测时间。
+    # 可用源在 stale_after 秒后过期；失败源按指数退避复测（backoff_base × 2^(连续失败次数-1)，上限 backoff_max）。
+    def __init__(self, path, stale_after=3600, backoff_base=3600, backoff_max=7 * 24 * 3600, retention=90 * 24 * 3600):
+        self.stale_after = stale_after
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.lock = threading.Lock()
+        try:
+            self.db = sqlite3.connect(path, check_same_thread=False)
+            self.db.execute("PRAGMA journal_mode=WAL")
+        except sqlite3.Error:
+            self.db = sqlite3.connect(":memory:", check_same_thread=False)
+        with self.lock, self.db:
+            self.db.executescript("""
+                CREATE TABLE IF NOT EXISTS probes (url TEXT, ts REAL, ok INTEGER, status TEXT, detail TEXT, duration REAL);
+                CREATE INDEX IF NOT EXISTS probes_url_ts ON probes (url, ts);
+                CREATE TABLE IF NOT EXISTS mirrors (url TEXT PRIMARY KEY, ts REAL, ok INTEGER, status TEXT, detail TEXT,
+                                                    duration REAL, failures INTEGER, next_due REAL);
+            """)
+            self.db.execute("DELETE FROM probes WHERE ts < ?", (time.time() - retention,))
+
+    def record(self, result, ts=None):
+        url, status, detail, duration, ok = result
+        ts = ts or time.time()
+        with self.lock, self.db:
+            row = self.db.execute("SELECT failures FROM mirrors WHERE url = ?", (url,)).fetchone()
+            if ok:
+                failures = 0
+                next_due = ts + self.stale_after
+            else:
+                failures = (row[0] if row else 0) + 1
+                next_due = ts + min(self.backoff_base * 2 ** min(failures - 1, 32), self.backoff_max)
+            self.db.execute("INSERT INTO probes VALUES (?, ?, ?, ?, ?, ?)", (url, ts, int(ok), status, detail, duration))
+            self.db.execute("INSERT OR REPLACE INTO mirrors VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                            (url, ts, int(ok), status, detail, duration, failures, next_due))
+
+    def due(self, urls, now=None):
+        now = now or time.time()
+        with self.lock:
+            next_due = dict(self.db.execute("SELECT url, next_due FROM mirrors"))
+        return [url for url in urls if next_due.get(url, 0) <= now]
+
+    def last_results(self, urls):
+        with self.lock:
+            rows = {row[0]: row for row in self.db.execute("SELECT url, status, detail, duration, ok FROM mirrors")}
+        return [(url, rows[url][1], rows[url][2], rows[url][3], bool(rows[url][4])) for url in urls if url in rows]
+
+    def recent_durations(self, url, limit=20):
+        with self.lock:
+            rows = self.db.execute("SELECT duration FROM probes WHERE url = ? AND ok = 1 ORDER BY ts DESC LIMIT ?",
+                                   (url, limit)).fetchall()
+        return [row[0] for row in rows]
+
+    def last_tested(self, urls):
+        with self.lock:
+            ts = dict(self.db.execute("SELECT url, ts FROM mirrors"))
+        return max((ts[url] for url in urls if url in ts), default=0)
+
+
+class _RegistryProxyHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        self.server.proxy.handle(self)
+
+    do_HEAD = do_GET
+
+
+class RegistryProxy:
+    # 本地拉取代理：/v2/ 请求转发到当前排名最优的镜像源，出错时依次切换到后续源；
+    # blob 按摘要缓存到磁盘（LRU 淘汰，总大小不超过 cache_limit），上游排名由后台线程周期性复测刷新。
+    def __init__(self, tester, mirrors, port=5000, cache_dir=None, cache_limit=10 * 1024 ** 3, refresh_interval=600):
+        self.tester = tester
+        self.mirrors = list(mirrors)
+        self.port = port
+        self.cache_dir = cache_dir or os.path.join(tester.app_dir, "registry_cache")
+        self.cache_limit = cache_limit
+        self.refresh_interval = refresh_interval
+        self.upstreams = list(mirrors)
+        self.cache = OrderedDict()
+        self.cache_size = 0
+        self.lock = threading.Lock()
+        self.stop_event = threading.Event()
+        self.server = None
+        self.stats = {'requests': 0, 'hits': 0, 'failover': 0, 'errors': 0}
+
+    def start(self, ranking=None):
+        if ranking:
+            self.upstreams = list(ranking)
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self._load_cache()
+        self.server = http.server.ThreadingHTTPServer(('127.0.0.1', self.port), _RegistryProxyHandler)
+        self.server.daemon_threads = True
+        self.server.proxy = self
+        self.stop_event.clear()
+        for target in (self.server.serve_forever, self._refresh_loop):
+            t = threading.Thread(target=target)
+            t.daemon = True
+            t.start()
+
+    def stop(self):
+        self.stop_event.set()
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+
+    def _refresh_loop(self):
+        while not self.stop_event.wait(self.refresh_interval):
+            try:
+                ranking = self.tester.rank_mirrors(self.mirrors)
+            except Exception:
+                continue
+            if ranking:
+                with self.lock:
+                    self.upstreams = ranking
+
+    def _load_cache(self):
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            path = os.path.join(self.cache_dir, name)
+            if re.fullmatch(r'[0-9a-f]{64}', name):
+                st = os.stat(path)
+                entries.append((st.st_mtime, name, st.st_size))
+            elif name.endswith('.part'):
+                os.remove(path)
+        with self.lock:
+            self.cache.clear()
+            self.cache_size = 0
+            for _, name, size in sorted(entries):
+                self.cache[name] = size
+                self.cache_size += size
+        self._evict()
+
+    def _evict(self):
+        with self.lock:
+            victims = []
+            while self.cache_size > self.cache_limit and self.cache:
+                name, size = self.cache.popitem(last=False)
+                self.cache_size -= size
+                victims.append(name)
+        for name in victims:
+            try:
+                os.remove(os.path.join(self.cache_dir, name))
+            except OSError:
+                pass
+
+    def _demote(self, mirror):
+        with self.lock:
+            if mirror in self.upstreams and self.upstreams[-1] != mirror:
+                self.upstreams.remove(mirror)
+                self.upstreams.append(mirror)
+                self.stats['failover'] += 1
+
+    def _send_head(self, req, status, headers):
+        req.send_response(status)
+        for k, v in headers.items():
+            req.send_header(k, v)
+        if 'Content-Length' not in headers:
+            req.send_header('Connection', 'close')
+            req.close_connection = True
+        req.end_headers()
+
+    def handle(self, req):
+        with self.lock:
+            self.stats['requests'] += 1
+        path = req.path.split('?', 1)[0]
+        if path.rstrip('/') == '/v2':
+            body = b'{}'
+            self._send_head(req, 200, {'Content-Type': 'application/json', 'Content-Length': str(len(body)),
+                                       'Docker-Distribution-API-Version': 'registry/2.0'})
+            if req.command == 'GET':
+                req.wfile.write(body)
+            return
+        blob = BLOB_PATH.match(path)
+        if blob and 'Range' not in req.headers and self._serve_cached(req, blob.group(1)):
+            with self.lock:
+                self.stats['hits'] += 1
+            return
+        self._forward(req, blob.group(1) if blob and 'Range' not in req.headers else None)
+
+    def _serve_cached(self, req, digest):
+        path = os.path.join(self.cache_dir, digest)
+        with self.lock:
+            if digest not in self.cache:
+                return False
+            self.cache.move_to_end(digest)
+        try:
+            f = open(path, 'rb')
+        except OSError:
+            with self.lock:
+                self.cache_size -= self.cache.pop(digest, 0)
+            return False
+        with f:
+            os.utime(path)
+            self._send_head(req, 200, {'Content-Type': 'application/octet-stream',
+                                       'Content-Length': str(os.fstat(f.fileno()).st_size),
+                                       'Docker-Content-Digest': f"sha256:{digest}"})
+            if req.command == 'GET':
+                shutil.copyfileobj(f, req.wfile, 1024 * 1024)
+        return True
+
+    def _forward(self, req, digest):
+        """按排名依次尝试上游：连接失败或 5xx 切换到下一个源，404 也继续尝试（部分源只缓存热门仓库）"""
+        m = REPO_PATH.match(req.path)
+        scope = f"repository:{m.group(1)}:pull" if m else None
+        headers = {'Accept-Encoding': 'identity'}
+        for name in ('Accept', 'Range', 'If-None-Match'):
+            if name in req.headers:
+                headers[name] = req.headers[name]
+        with self.lock:
+            upstreams = list(self.upstreams)
+        status = 502
+        for mirror in upstreams:
+            session = self.tester._registry_session()
+            try:
+                r, _ = self.tester._registry_get(session, mirror, req.path, scope, headers, stream=True, method=req.command)
+            except requests.RequestException:
+                session.close()
+                self._demote(mirror)
+                continue
+            if r.status_code >= 500 or r.status_code in (401, 403, 404, 429):
+                if r.status_code != 404:
+                    self._demote(mirror)
+                status = 404 if r.status_code == 404 or status == 404 else status
+                r.close()
+                session.close()
+                continue
+            try:
+                self._relay(req, r, digest)
+            finally:
+                r.close()
+                session.close()
+            return
+        with self.lock:
+            self.stats['errors'] += 1
+        body = b'{"errors":[{"code":"UNAVAILABLE","message":"no upstream mirror could serve this request"}]}'
+        self._send_head(req, status, {'Content-Type': 'application/json', 'Content-Length': str(len(body))})
+        if req.command == 'GET':
+            req.wfile.write(body)
+
+    def _relay(self, req, r, digest):
+        """把上游响应转发给客户端；完整 blob 同时写入临时文件，摘要校验通过后放入缓存"""
+        headers = {k: r.headers[k] for k in ('Content-Type', 'Content-Length', 'Content-Range', 'Docker-Content-Digest', 'ETag')
+                   if k in r.headers}
+        self._send_head(req, r.status_code, headers)
+        if req.command != 'GET':
+            return
+        sink = None
+        if digest and r.status_code == 200:
+            fd, tmp = tempfile.mkstemp(suffix='.part', dir=self.cache_dir)
+            sink = os.fdopen(fd, 'wb')
+            hasher = hashlib.sha256()
+        try:
+            for chunk in r.raw.stream(65536, decode_content=False):
+                req.wfile.write(chunk)
+                if sink:
+                    sink.write(chunk)
+                    hasher.update(chunk)
+        except Exception:
+            if sink:
+                sink.close()
+                os.remove(tmp)
+            raise
+        if sink:
+            sink.close()
+            if hasher.hexdigest() != digest:
+                os.remove(tmp)
+                return
+            size = os.path.getsize(tmp)
+            os.replace(tmp, os.path.join(self.cache_dir, digest))
+            with self.lock:
+                self.cache_size += size - self.cache.pop(digest, 0)
+                self.cache[digest] = size
+            self._evict()
+
 def main():
-    root = tk.Tk()
-    app = DockerMirrorTester(root)
-    root.mainloop()
+    parser = argparse.ArgumentParser(description="Docker 镜像源测试工具")
+    parser.add_argument("--headless", action="store_true", help="不启动界面，结果以 JSON Lines 输出到标准输出")
+    parser.add_argument("-i", "--input", help="镜像源列表文件，'-' 表示从标准输入读取（默认 mirrors.txt）")
+    parser.add_argument("--timeout", type=float, help="单个请求超时（秒）")
+    parser.add_argument("--full", action="store_true", help="忽略历史记录，复测全部镜像源")
+    parser.add_argument("--race", type=int, metavar="K", help="竞速模式：确认最快的 K 个可用源后立即结束")
+    parser.add_argument("--deadline", type=float, metavar="SECONDS", help="整体时限，到时结束并使用已得到的结果")
+    parser.add_argument("--image", help="测试完成后对可用源执行 registry v2 拉取测速，例如 ubuntu:latest")
+    parser.add_argument("--estimate", nargs='+', metavar="IMAGE", help="预估每个镜像在各可用源上的拉取耗时并推荐最快的源")
+    parser.add_argument("--load-profile", action="store_true", help="配合 --image：测量各可用源在 1/2/4/8/16 并发下的聚合吞吐与错误率")
+    parser.add_argument("--download", metavar="PATH", help="配合 --image：从多个可用源并行下载镜像并保存为可 docker load 的 tar")
+    parser.add_argument("--serve", type=int, metavar="PORT", help="检测完成后在 127.0.0.1:PORT 启动本地拉取代理（需配合 --headless）")
+    args = parser.parse_args()
+
+    if not args.headless:
+        if tk is None:
+            parser.error("当前环境缺少 tkinter，请使用 --headless")
+        root = tk.Tk()
+        app = DockerMirrorTester(root)
+        root.mainloop()
+        return
+
+    app = DockerMirrorTester()
+    app.full_retest = args.full
+    app.race_k = args.race or 0
+    app.deadline = args.deadline
+    if args.timeout:
+        app.timeout = args.timeout
+    if args.input == '-':
+        content = sys.stdin.read()
+    else:
+        path = args.input or app.default_file
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                content = f.read()
+        except OSError as e:
+            parser.error(f"无法读取镜像源列表 {path}: {e.strerror or e}")
+    mirrors = app._parse_mirrors(content)
+    if not mirrors:
+        parser.error("未找到有效的镜像源")
+    working = app.run_headless(mirrors)
+    if (args.download or args.load_profile) and not args.image:
+        parser.error("--download 与 --load-profile 需要同时指定 --image")
+    if args.image and working:
+        app.benchmark_mirrors([r[0] for r in working], args.image)
+        if args.load_profile:
+            app.load_profile_mirrors([r[0] for r in app._bench_ranking()], args.image)
+        if args.download:
+            app._download_worker(args.image, [r[0] for r in app._bench_ranking()], args.download)
+    if args.estimate and working:
+        app._estimate_worker(args.estimate, [r[0] for r in working])
+    if args.serve and working:
+        proxy = RegistryProxy(app, mirrors, port=args.serve, cache_dir=app.proxy_cache_dir, cache_limit=app.proxy_cache_limit)
+        proxy.start([r[0] for r in app._bench_ranking()])
+        app._emit({'type': 'serve', 'listen': f"http://127.0.0.1:{args.serve}", 'upstreams': proxy.upstreams})
+        try:
+            while True:
+                time.sleep(3600)
+        except KeyboardInterrupt:
+            proxy.stop()
+    sys.exit(0 if working else 1)
 
 if __name__ == "__main__":
     main()
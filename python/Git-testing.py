@@ -1,30 +1,72 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
-import tkinter as tk
-from tkinter import ttk, scrolledtext, messagebox, filedialog
+try:
+    import tkinter as tk
+    from tkinter import ttk, scrolledtext, messagebox, filedialog
+except ImportError:
+    tk = None
 import threading
+import queue
 import requests
 import time
 import pyperclip
 import os
 import re
 import sys
+import json
+import argparse
+import http.server
+import subprocess
+import shutil
+from mirror_common import MirrorProbeMixin
 
-class GitMirrorTester:
-    def __init__(self, root):
+class GitMirrorTester(MirrorProbeMixin):
+    user_agent = "Mozilla/5.0 GitMirrorTester"
+
+    def __init__(self, root=None, output=None):
         self.root = root
-        self.root.title("Git 镜像源测试工具")
-        self.root.geometry("950x650")
+        self.output = output or sys.stdout
         self.timeout = 10
+        self.timeout_floor = 3.0
+        self.adaptive_share = 0.5
+        self.timeout_factor = 4
+        self.hedge_factor = 2
+        self._sweep_latencies = []
+        self._sweep_total = 0
+        self.latency_history = None
+        self.history_size = 20
         self.results = []
+        self.phases = {}
+        self._ssl_context = None
+        self.ref_repo = "https://github.com/octocat/Hello-World.git"
+        self.refs = {}
+        self.pack_repo = "https://github.com/psf/requests.git"
+        self.pack_seconds = 10
+        self.packs = {}
+        self.verify_workers = 16
+        self.verdicts = None
+        self.verdict_ttl = 30 * 60
+        self.search_workers = 6
+        self.search_cache_ttl = 3600
+        self.search_max_bytes = 512 * 1024
         self.is_testing = False
         self.app_dir = self._get_app_dir()
         self.default_file = os.path.join(self.app_dir, "mirrors.txt")
+        self.verdict_file = os.path.join(self.app_dir, "crawl_verdicts.json")
+        self.latency_file = os.path.join(self.app_dir, "latency_history.json")
+        self.search_cache_dir = os.path.join(self.app_dir, "search_cache")
+        self.cache_server = None
+        self.cache_port = 8418
+        self.cache_dir = os.path.join(self.app_dir, "git_cache")
+        self.cache_repos_file = os.path.join(self.app_dir, "cache_repos.txt")
         self.archive_dir = os.path.join(os.path.expanduser("~"), "Desktop", "Git镜像源测试_保留")
-        os.makedirs(self.archive_dir, exist_ok=True)
-        self.create_widgets()
-        self.load_default_file()
+        if self.root is not None:
+            os.makedirs(self.archive_dir, exist_ok=True)
+            self.root.title("Git 镜像源测试工具")
+            self.root.geometry("950x650")
+            self.create_widgets()
+            self.load_default_file()
 
     def create_widgets(self):
         main_frame = ttk.Frame(self.root, padding="10")
@@ -71,17 +113,23 @@ class GitMirrorTester:
 
         ttk.Label(main_frame, text="测试结果：", font=('Arial', 10, 'bold')).grid(row=6, column=0, sticky=tk.W)
 
-        columns = ("状态", "响应时间", "镜像源地址")
+        columns = ("状态", "响应时间", "DNS/TCP/TLS/首字节", "复用请求", "克隆就绪", "镜像源地址")
         self.tree = ttk.Treeview(main_frame, columns=columns, show="headings", height=12)
         self.tree.grid(row=7, column=0, columnspan=2, sticky=(tk.W, tk.E, tk.N, tk.S))
 
         self.tree.heading("状态", text="状态")
         self.tree.heading("响应时间", text="响应时间")
+        self.tree.heading("DNS/TCP/TLS/首字节", text="DNS/TCP/TLS/首字节")
+        self.tree.heading("复用请求", text="复用请求")
+        self.tree.heading("克隆就绪", text="克隆就绪")
         self.tree.heading("镜像源地址", text="镜像源地址")
 
         self.tree.column("状态", width=80, anchor=tk.CENTER)
         self.tree.column("响应时间", width=100, anchor=tk.CENTER)
-        self.tree.column("镜像源地址", width=450)
+        self.tree.column("DNS/TCP/TLS/首字节", width=170, anchor=tk.CENTER)
+        self.tree.column("复用请求", width=120, anchor=tk.CENTER)
+        self.tree.column("克隆就绪", width=110, anchor=tk.CENTER)
+        self.tree.column("镜像源地址", width=300)
 
         scrollbar = ttk.Scrollbar(main_frame, orient=tk.VERTICAL, command=self.tree.yview)
         scrollbar.grid(row=7, column=2, sticky=(tk.N, tk.S))
@@ -122,6 +170,25 @@ class GitMirrorTester:
         self.copy_proxy_btn = ttk.Button(proxy_frame, text="📋 复制代理克隆命令", command=self.copy_proxy_clone, state=tk.DISABLED)
         self.copy_proxy_btn.pack(side=tk.LEFT)
 
+        ref_frame = ttk.Frame(main_frame)
+        ref_frame.grid(row=11, column=0, columnspan=3, sticky=(tk.W, tk.E), pady=(6, 0))
+        ttk.Label(ref_frame, text="参考仓库：").pack(side=tk.LEFT)
+        self.ref_repo_entry = ttk.Entry(ref_frame, width=60)
+        self.ref_repo_entry.pack(side=tk.LEFT, padx=(5, 5))
+        self.ref_repo_entry.insert(0, self.ref_repo)
+        ttk.Label(ref_frame, text="（测试时经各镜像拉取 info/refs 判断能否克隆）").pack(side=tk.LEFT)
+
+        pack_frame = ttk.Frame(main_frame)
+        pack_frame.grid(row=12, column=0, columnspan=3, sticky=(tk.W, tk.E), pady=(6, 0))
+        ttk.Label(pack_frame, text="测速仓库：").pack(side=tk.LEFT)
+        self.pack_repo_entry = ttk.Entry(pack_frame, width=60)
+        self.pack_repo_entry.pack(side=tk.LEFT, padx=(5, 5))
+        self.pack_repo_entry.insert(0, self.pack_repo)
+        self.pack_btn = ttk.Button(pack_frame, text="📦 克隆测速", command=self.start_pack_benchmark, state=tk.DISABLED)
+        self.pack_btn.pack(side=tk.LEFT)
+        self.cache_btn = ttk.Button(pack_frame, text="🗄️ 启动本地缓存", command=self.toggle_cache_server, state=tk.DISABLED)
+        self.cache_btn.pack(side=tk.LEFT, padx=(5, 0))
+
     def select_file(self):
         filename = filedialog.askopenfilename(
             title="选择镜像源文件",
@@ -159,6 +226,9 @@ class GitMirrorTester:
         self.save_clean_btn.config(state=tk.DISABLED)
         self.copy_btn.config(state=tk.DISABLED)
 
+    def _parse_mirrors(self, content):
+        return [self._normalize_url(line.strip()) for line in content.split('\n') if line.strip() and not line.strip().startswith('#')]
+
     def start_test(self):
         if self.is_testing:
             return
@@ -166,7 +236,7 @@ class GitMirrorTester:
         if not content:
             messagebox.showwarning("警告", "请输入或导入镜像源")
             return
-        mirrors = [self._normalize_url(line.strip()) for line in content.split('\n') if line.strip() and not line.strip().startswith('#')]
+        mirrors = self._parse_mirrors(content)
         if not mirrors:
             messagebox.showwarning("警告", "未找到有效的镜像源")
             return
@@ -178,50 +248,323 @@ class GitMirrorTester:
         self.delete_btn.config(state=tk.DISABLED)
         self.save_clean_btn.config(state=tk.DISABLED)
         self.copy_btn.config(state=tk.DISABLED)
+        self.pack_btn.config(state=tk.DISABLED)
         self.results = []
+        self.phases = {}
+        self.refs = {}
+        self.packs = {}
+        self.ref_repo = self.ref_repo_entry.get().strip() or self.ref_repo
         self.tree.delete(*self.tree.get_children())
         self.status_label.config(text=f"开始测试 {len(mirrors)} 个镜像源...")
         thread = threading.Thread(target=self.test_mirrors, args=(mirrors,))
         thread.daemon = True
         thread.start()
 
+    def _post(self, fn, *args):
+        if self.root is not None:
+            self.root.after(0, fn, *args)
+        else:
+            fn(*args)
+
+    def _emit(self, record):
+        self.output.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self.output.flush()
+
+    def run_headless(self, mirrors):
+        self.results = []
+        self.phases = {}
+        self.refs = {}
+        self.packs = {}
+        self.test_mirrors(mirrors)
+        return [r for r in self.results if r[4]]
+
     def test_mirrors(self, mirrors):
+        self._sweep_latencies = []
         total = len(mirrors)
+        self._sweep_total = total
         for idx, mirror in enumerate(mirrors, 1):
             progress = (idx / total) * 100
-            self.root.after(0, self.update_progress, progress, f"测试进度: {idx}/{total}")
+            self._post(self.update_progress, progress, f"测试进度: {idx}/{total}")
             url = mirror.strip()
             status_code, duration, error = self.test_mirror(url)
             if error:
                 result = (url, "❌ 失败", error, duration, False)
             else:
                 if 200 <= status_code < 400:
+                    self.refs[url] = self.probe_refs(url)
                     result = (url, "✅ 成功", f"{status_code}", duration, True)
                 else:
                     result = (url, "⚠️ 异常", f"{status_code}", duration, False)
             self.results.append(result)
-            self.root.after(0, self.update_result, result)
-        self.root.after(0, self.test_complete)
+            self._post(self.update_result, result)
+        self._save_latency_history()
+        self._post(self.test_complete)
+
+    def _quantile(self, values, q):
+        ordered = sorted(values)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+    def _adaptive_timeout(self, url):
+        # 基准取本轮已完成探测耗时的 p90 与该源近期最大耗时中的较大者：超时为基准的 timeout_factor 倍，
+        # 限制在 [timeout_floor, timeout]，对冲等待为基准的 hedge_factor 倍。本轮样本含超时与失败的探测
+        # （按已耗时计入），完成数不足 adaptive_share 时只参考历史；两者都没有时使用固定超时
+        basis = []
+        if len(self._sweep_latencies) >= max(5, self._sweep_total * self.adaptive_share):
+            basis.append(self._quantile(self._sweep_latencies, 0.9))
+        history = self._load_latency_history().get(url)
+        if history:
+            basis.append(max(history))
+        if not basis:
+            return self.timeout, self.timeout / 2
+        base = max(basis)
+        timeout = min(self.timeout, max(self.timeout_floor, base * self.timeout_factor))
+        return timeout, min(timeout / 2, max(self.timeout_floor / 2, base * self.hedge_factor))
 
     def test_mirror(self, url):
+        # 自适应超时内未返回时再按固定超时 self.timeout 测一次，仍超时才判定为超时
+        timeout, hedge_after = self._adaptive_timeout(url)
+        ok, value, duration = self._hedged_probe(url, timeout, hedge_after)
+        if not ok and self._timed_out(value) and timeout < self.timeout:
+            timeout = self.timeout
+            ok, value, retry = self._hedged_probe(url, timeout, timeout / 2)
+            duration = retry if ok else duration + retry
+        self._sweep_latencies.append(duration)
+        if not ok:
+            if self._timed_out(value):
+                return None, timeout, "超时"
+            return None, 0, f"错误: {value}"
+        self.phases[url] = value[1]
+        history = self._load_latency_history().setdefault(url, [])
+        history.append(round(duration, 4))
+        del history[:-self.history_size]
+        return value[0], duration, None
+
+    def _refs_url(self, mirror, style, repo=None):
+        # prefix：镜像地址后拼接完整 GitHub 地址；host：用镜像域名替换 github.com
+        repo = self._normalize_github_url(repo or self.ref_repo)
+        if style == 'host':
+            repo = repo.split('github.com/', 1)[-1]
+        return f"{mirror.rstrip('/')}/{repo}"
+
+    def _refs_probe(self, mirror, style):
+        # 按 smart HTTP 协议请求 info/refs，校验 Content-Type 与首个 pkt-line，
+        # 返回首字节耗时、完整读完引用通告的耗时与字节数
+        url = self._refs_url(mirror, style) + "/info/refs?service=git-upload-pack"
+        headers = {'User-Agent': "git/2.45.0 (GitMirrorTester)", 'Git-Protocol': 'version=2'}
+        start = time.perf_counter()
+        with requests.get(url, headers=headers, timeout=self.timeout, stream=True) as r:
+            ttfb = time.perf_counter() - start
+            if r.status_code != 200:
+                raise ValueError(f"HTTP {r.status_code}")
+            ctype = r.headers.get('Content-Type', '').split(';')[0].strip()
+            if ctype != 'application/x-git-upload-pack-advertisement':
+                raise ValueError(f"非 smart HTTP 响应 ({ctype or '无 Content-Type'})")
+            body = r.raw.read(decode_content=True)
+        total = time.perf_counter() - start
+        try:
+            size = int(body[:4], 16)
+        except ValueError:
+            size = 0
+        # 协议 v2 下 git http-backend 直接以 "version 2" 开头，省略 service 行
+        if size < 4 or not body[4:size].startswith((b"# service=git-upload-pack", b"version 2")):
+            raise ValueError("引用通告格式错误")
+        return {'ttfb': ttfb, 'total': total, 'bytes': len(body)}
+
+    def probe_refs(self, mirror):
+        # 两种拼接方式都测一遍，取引用通告最快的一种作为该镜像的克隆方式
+        info = {'style': None, 'total': None, 'styles': {}}
+        for style in ('prefix', 'host'):
+            try:
+                outcome = self._refs_probe(mirror, style)
+            except Exception as e:
+                info['styles'][style] = {'error': str(e)}
+                continue
+            info['styles'][style] = outcome
+            if info['total'] is None or outcome['total'] < info['total']:
+                info.update(style=style, ttfb=outcome['ttfb'], total=outcome['total'])
+        return info
+
+    def _pkt_lines(self, lines):
+        out = b""
+        for line in lines:
+            if line is None:
+                out += b"0000"
+            else:
+                data = line.encode()
+                out += f"{len(data) + 4:04x}".encode() + data
+        return out
+
+    def _advertised_head(self, session, base):
+        # 用 v0 协议取引用通告，返回要拉取的提交和服务端能力列表
+        r = session.get(base + "/info/refs?service=git-upload-pack", timeout=self.timeout)
+        if r.status_code != 200:
+            raise ValueError(f"info/refs 返回 {r.status_code}")
+        data = r.content
+        pos = 0
+        first, caps = None, set()
+        while pos + 4 <= len(data):
+            size = int(data[pos:pos + 4], 16)
+            if size == 0:
+                pos += 4
+                continue
+            line = data[pos + 4:pos + size].rstrip(b"\n")
+            pos += size
+            if line.startswith(b"#"):
+                continue
+            ref, _, extra = line.partition(b"\0")
+            if extra:
+                caps = set(extra.decode().split())
+            sha, _, name = ref.decode().partition(' ')
+            if first is None or name == 'HEAD':
+                first = sha
+            if name == 'HEAD':
+                break
+        if not first or first == '0' * 40:
+            raise ValueError("仓库没有可拉取的引用")
+        return first, caps
+
+    def _pack_probe(self, mirror, style):
+        # 对测速仓库做一次 upload-pack 协商（单个 want + done），边收边按 pkt-line/side-band
+        # 解析，只统计 pack 数据字节数，不落盘；超过 pack_seconds 即停止并按已收数据计算速率
+        stats = {'ok': False, 'style': style}
+        base = self._refs_url(mirror, style, self.pack_repo)
+        session = requests.Session()
+        session.headers['User-Agent'] = "git/2.45.0 (GitMirrorTester)"
         try:
-            start_time = time.time()
-            response = requests.head(url, timeout=self.timeout, allow_redirects=True)
-            end_time = time.time()
-            return response.status_code, end_time - start_time, None
-        except requests.exceptions.Timeout:
-            return None, self.timeout, "超时"
+            t = time.perf_counter()
+            want, caps = self._advertised_head(session, base)
+            stats['refs'] = time.perf_counter() - t
+            sideband = 'side-band-64k' in caps
+            wanted = [c for c in ('side-band-64k', 'ofs-delta', 'no-progress') if c in caps]
+            body = self._pkt_lines([f"want {want} {' '.join(wanted + ['agent=git/2.45.0'])}\n", None, "done\n"])
+            headers = {'Content-Type': 'application/x-git-upload-pack-request',
+                       'Accept': 'application/x-git-upload-pack-result'}
+            start = time.perf_counter()
+            first = None
+            received = 0
+            complete = False
+            buf = b""
+            in_pack = False
+            with session.post(base + "/git-upload-pack", data=body, headers=headers, timeout=self.timeout, stream=True) as r:
+                if r.status_code != 200:
+                    raise ValueError(f"git-upload-pack 返回 {r.status_code}")
+                for chunk in r.iter_content(65536):
+                    now = time.perf_counter()
+                    if in_pack:
+                        first = first or now
+                        received += len(chunk)
+                    else:
+                        buf += chunk
+                        while len(buf) >= 4:
+                            size = int(buf[:4], 16)
+                            if size == 0:
+                                buf = buf[4:]
+                                complete = sideband
+                                continue
+                            if len(buf) < size:
+                                break
+                            payload, buf = buf[4:size], buf[size:]
+                            if not sideband:
+                                # 无 side-band 时 NAK 之后就是原始 pack 流
+                                in_pack = True
+                                if buf:
+                                    first = first or now
+                                    received += len(buf)
+                                    buf = b""
+                                break
+                            if payload[:1] == b"\x01":
+                                first = first or now
+                                received += len(payload) - 1
+                            elif payload[:1] == b"\x03":
+                                raise ValueError(f"服务端报错: {payload[1:].decode(errors='replace').strip()}")
+                    if now - start > self.pack_seconds:
+                        break
+                else:
+                    complete = complete or in_pack
+            end = time.perf_counter()
+            if not received:
+                raise ValueError("未收到 pack 数据")
+            stats.update(ttfb=first - start, bytes=received, seconds=end - start, complete=complete,
+                         rate=received / max(end - first, 1e-6))
+            stats['ok'] = True
+        except requests.Timeout:
+            stats['error'] = "超时"
         except Exception as e:
-            return None, 0, f"错误: {e}"
+            stats['error'] = f"错误: {e}"
+        finally:
+            session.close()
+        return stats
+
+    def _ranked_working(self):
+        # 有 pack 测速结果的按速率从高到低排在最前，其次是能返回引用通告的镜像
+        # （按通告耗时），其余按首页响应时间排序
+        def key(r):
+            stats = self.packs.get(r[0]) or {}
+            if stats.get('ok'):
+                return (0, -stats['rate'])
+            refs = self.refs.get(r[0]) or {}
+            if refs.get('style'):
+                return (1, refs['total'])
+            return (2, r[3])
+        return sorted((r for r in self.results if r[4]), key=key)
+
+    def _refs_label(self, url):
+        refs = self.refs.get(url)
+        if not refs:
+            return "-"
+        if not refs['style']:
+            return "✗ 不可克隆"
+        name = {'prefix': '前缀', 'host': '替换域名'}[refs['style']]
+        stats = self.packs.get(url) or {}
+        if stats.get('ok'):
+            return f"{name} {stats['rate'] / 1048576:.2f}MB/s"
+        return f"{name} {refs['total']*1000:.0f}ms"
+
+    def _tree_values(self, result):
+        url, status, msg, duration, success = result
+        phases = self.phases.get(url)
+        stages = "-"
+        warm = "-"
+        if phases:
+            if phases['tcp'] is None:
+                stages = f"经代理 首字节{phases['ttfb']*1000:.0f}ms"
+            else:
+                stages = "/".join(f"{phases[k]*1000:.0f}" for k in ('dns', 'tcp', 'tls', 'ttfb')) + "ms"
+            if phases['warm'] is not None:
+                label = {'backend': ' 后端为主', 'network': ' 链路为主', None: ''}[self._diagnose(phases)]
+                warm = f"{phases['warm']*1000:.0f}ms{label}"
+        return (status, f"{duration:.3f}s", stages, warm, self._refs_label(url), url)
+
+    def _round_floats(self, value):
+        if isinstance(value, float):
+            return round(value, 4)
+        if isinstance(value, dict):
+            return {k: self._round_floats(v) for k, v in value.items()}
+        if isinstance(value, list):
+            return [self._round_floats(v) for v in value]
+        return value
 
     def update_progress(self, value, text):
+        if self.root is None:
+            return
         self.progress_var.set(value)
         self.status_label.config(text=text)
 
     def update_result(self, result):
         url, status, msg, duration, success = result
+        if self.root is None:
+            record = {'type': 'result', 'url': url, 'ok': success, 'detail': msg, 'duration': round(duration, 4)}
+            phases = self.phases.get(url)
+            if phases:
+                record['phases'] = self._round_floats(phases)
+                record['bottleneck'] = self._diagnose(phases)
+            refs = self.refs.get(url)
+            if refs:
+                record['refs'] = self._round_floats(refs)
+            self._emit(record)
+            return
         tag = 'success' if success else 'failed'
-        self.tree.insert('', 'end', values=(status, f"{duration:.3f}s", url), tags=(tag,))
+        self.tree.insert('', 'end', values=self._tree_values(result), tags=(tag,))
         if not hasattr(self, 'tree_style'):
             self.tree.tag_configure('success', foreground='#006400', background='#F0FFF0')
             self.tree.tag_configure('failed', foreground='#8B0000', background='#FFF0F0')
@@ -229,15 +572,24 @@ class GitMirrorTester:
 
     def test_complete(self):
         self.is_testing = False
+        self._refresh_cache_upstreams()
+        if self.root is None:
+            working = self._ranked_working()
+            self._emit({'type': 'summary', 'ranking': [r[0] for r in working],
+                        'styles': {r[0]: self.refs[r[0]]['style'] for r in working if r[0] in self.refs}})
+            return
         self.test_btn.config(text="🚀 开始测试", state=tk.NORMAL)
         self.load_default_btn.config(state=tk.NORMAL)
         self.import_btn.config(state=tk.NORMAL)
         self.clear_btn.config(state=tk.NORMAL)
-        working = [r for r in self.results if r[4]]
+        working = self._ranked_working()
         failed = [r for r in self.results if not r[4]]
         self.delete_btn.config(state=tk.NORMAL if failed else tk.DISABLED)
         self.save_clean_btn.config(state=tk.NORMAL if working else tk.DISABLED)
         self.copy_btn.config(state=tk.NORMAL if working else tk.DISABLED)
+        ready = any((self.refs.get(r[0]) or {}).get('style') for r in working)
+        self.pack_btn.config(state=tk.NORMAL if ready else tk.DISABLED)
+        self.cache_btn.config(state=tk.NORMAL if ready else tk.DISABLED)
         try:
             ts = time.strftime('%Y%m%d_%H%M%S')
             log_path = os.path.join(self.archive_dir, f"git_mirrors_test_{ts}.txt")
@@ -246,8 +598,10 @@ class GitMirrorTester:
                 f.write("=" * 60 + "\n\n")
                 f.write(f"测试时间: {time.strftime('%Y-%m-%d %H:%M:%S')}\n\n")
                 f.write(f"✅ 可用镜像源 ({len(working)} 个):\n")
-                for url, _, _, duration, _ in sorted(working, key=lambda x: x[3]):
-                    f.write(f"   {duration:.3f}s  {url}\n")
+                f.write(f"参考仓库: {self.ref_repo}\n")
+                for r in working:
+                    _, _, stages, warm, refs, url = self._tree_values(r)
+                    f.write(f"   {r[3]:.3f}s  {url}  [DNS/TCP/TLS/首字节 {stages} | 复用 {warm} | 克隆就绪 {refs}]\n")
                 f.write("\n❌ 不可用镜像源:\n")
                 for url, _, msg, duration, _ in failed:
                     f.write(f"   {duration:.3f}s  {url}  -> {msg}\n")
@@ -256,6 +610,137 @@ class GitMirrorTester:
         self.status_label.config(text=f"✅ 可用: {len(working)} 个 | ❌ 不可用: {len(failed)} 个")
         self.tree.yview_moveto(0.0)
 
+    def start_pack_benchmark(self):
+        if self.is_testing:
+            return
+        urls = [r[0] for r in self._ranked_working() if (self.refs.get(r[0]) or {}).get('style')]
+        if not urls:
+            messagebox.showwarning("提示", "没有能返回引用通告的镜像源，请先测试")
+            return
+        self.pack_repo = self.pack_repo_entry.get().strip() or self.pack_repo
+        self.is_testing = True
+        self.pack_btn.config(state=tk.DISABLED)
+        self.test_btn.config(state=tk.DISABLED)
+        self.status_label.config(text=f"开始克隆测速 {self.pack_repo}（{len(urls)} 个镜像源）...")
+        thread = threading.Thread(target=self.pack_benchmark, args=(urls,))
+        thread.daemon = True
+        thread.start()
+
+    def pack_benchmark(self, urls):
+        # 逐个镜像测速，避免多个镜像同时下载争抢本机带宽
+        self.packs = {}
+        total = len(urls)
+        for idx, url in enumerate(urls, 1):
+            self._post(self.update_progress, (idx / total) * 100, f"克隆测速进度: {idx}/{total}")
+            style = (self.refs.get(url) or {}).get('style')
+            if style:
+                stats = self._pack_probe(url, style)
+            else:
+                stats = {'ok': False, 'error': "引用通告不可用"}
+            self.packs[url] = stats
+            self._post(self.update_pack, url, stats)
+        self._post(self.pack_complete)
+
+    def update_pack(self, url, stats):
+        if self.root is None:
+            record = {'type': 'pack', 'url': url, 'repo': self.pack_repo}
+            record.update(self._round_floats(stats))
+            self._emit(record)
+
+    def pack_complete(self):
+        self.is_testing = False
+        self._refresh_cache_upstreams()
+        ranking = [r for r in self._ranked_working() if (self.packs.get(r[0]) or {}).get('ok')]
+        if self.root is None:
+            self._emit({'type': 'pack_summary', 'repo': self.pack_repo, 'ranking': [r[0] for r in ranking]})
+            return
+        self.pack_btn.config(state=tk.NORMAL)
+        self.test_btn.config(state=tk.NORMAL)
+        self.tree.delete(*self.tree.get_children())
+        for result in self._ranked_working() + [r for r in self.results if not r[4]]:
+            tag = 'success' if result[4] else 'failed'
+            self.tree.insert('', 'end', values=self._tree_values(result), tags=(tag,))
+        try:
+            ts = time.strftime('%Y%m%d_%H%M%S')
+            log_path = os.path.join(self.archive_dir, f"git_pack_bench_{ts}.txt")
+            with open(log_path, 'w', encoding='utf-8') as f:
+                f.write(f"Git 镜像源克隆测速: {self.pack_repo}\n")
+                f.write("=" * 60 + "\n\n")
+                for url, _, _, _, _ in ranking:
+                    stats = self.packs[url]
+                    f.write(f"   {stats['rate'] / 1048576:.2f}MB/s  首个 pack 字节 {stats['ttfb']*1000:.0f}ms  {stats['bytes'] / 1048576:.1f}MB  {url}\n")
+                f.write("\n❌ 测速失败:\n")
+                for url, stats in self.packs.items():
+                    if not stats['ok']:
+                        f.write(f"   {url}  -> {stats.get('error')}\n")
+        except Exception:
+            pass
+        if ranking:
+            self.status_label.config(text=f"✅ 克隆测速完成，最快: {ranking[0][0]}（{self.packs[ranking[0][0]]['rate'] / 1048576:.2f}MB/s），复制配置将使用该源")
+        else:
+            self.status_label.config(text="❌ 克隆测速全部失败")
+        self.tree.yview_moveto(0.0)
+
+    def cache_upstreams(self):
+        # 本地缓存服务的上游：能返回引用通告的镜像按当前排名排列，附带其拼接方式
+        return [(r[0], self.refs[r[0]]['style']) for r in self._ranked_working() if (self.refs.get(r[0]) or {}).get('style')]
+
+    def _refresh_cache_upstreams(self):
+        # 缓存服务运行期间每次测试或克隆测速结束后按新排名更新上游；本次没有可用上游时保留原有的
+        upstreams = self.cache_upstreams()
+        if self.cache_server is not None and upstreams:
+            self.cache_server.set_upstreams(upstreams)
+
+    def load_cache_repos(self, path=None):
+        path = path or self.cache_repos_file
+        with open(path, 'r', encoding='utf-8') as f:
+            return [line.strip() for line in f if line.strip() and not line.strip().startswith('#')]
+
+    def toggle_cache_server(self):
+        if self.cache_server is not None:
+            self.cache_server.stop()
+            self.cache_server = None
+            self.cache_btn.config(text="🗄️ 启动本地缓存")
+            self.status_label.config(text="本地缓存服务已停止")
+            return
+        upstreams = self.cache_upstreams()
+        if not upstreams:
+            return
+        try:
+            repos = self.load_cache_repos()
+        except OSError:
+            messagebox.showwarning("提示", f"请在 {self.cache_repos_file} 中按行填写需要缓存的 GitHub 仓库")
+            return
+        server = GitCacheServer(self, repos, port=self.cache_port, cache_dir=self.cache_dir)
+        try:
+            server.start(upstreams)
+        except Exception as e:
+            messagebox.showerror("错误", f"无法启动本地缓存服务: {e}")
+            return
+        self.cache_server = server
+        self.cache_btn.config(text="⏹️ 停止本地缓存")
+        self.status_label.config(text=f"✅ 本地缓存服务已启动 http://127.0.0.1:{self.cache_port}（{len(repos)} 个仓库）→ {upstreams[0][0]}")
+        usage = (
+            "本地缓存使用说明：\n"
+            f"   git config --global url.\"http://127.0.0.1:{self.cache_port}/\".insteadOf https://github.com/\n"
+            f"缓存列表（{self.cache_repos_file}）中的仓库从本地裸仓库直接提供，后台定期经最快的镜像增量同步；\n"
+            "不在列表中或尚未同步完成的仓库会被重定向到最快的镜像。\n"
+        )
+        self.usage_text.config(state=tk.NORMAL)
+        self.usage_text.delete('1.0', tk.END)
+        self.usage_text.insert('1.0', usage)
+        self.usage_text.config(state=tk.DISABLED)
+        self.copy_usage_btn.config(state=tk.NORMAL)
+
+    def update_sync(self, repo, record):
+        if self.root is None:
+            self._emit(self._round_floats(dict(record, type='sync', repo=repo)))
+            return
+        if record['ok']:
+            self.status_label.config(text=f"🗄️ 已同步 {repo}（{record['seconds']:.1f}s，经 {record['upstream']}）")
+        else:
+            self.status_label.config(text=f"❌ 同步失败 {repo}: {record['error']}")
+
     def delete_failed(self):
         working = [r for r in self.results if r[4]]
         failed = [r for r in self.results if not r[4]]
@@ -269,9 +754,9 @@ class GitMirrorTester:
         self.tree.delete(*self.tree.get_children())
         for result in working:
             url, status, msg, duration, _ = result
-            self.tree.insert('', 'end', values=(status, f"{duration:.3f}s", url), tags=('success',))
+            self.tree.insert('', 'end', values=self._tree_values(result), tags=('success',))
         self.input_text.delete('1.0', tk.END)
-        for url, _, _, _, _ in sorted(working, key=lambda x: x[3]):
+        for url, _, _, _, _ in self._ranked_working():
             self.input_text.insert(tk.END, f"{url}\n")
         self.status_label.config(text=f"✅ 已清理失败源，列表已更新！可用: {len(working)} 个")
         self.delete_btn.config(state=tk.DISABLED)
@@ -295,7 +780,7 @@ class GitMirrorTester:
         if filename:
             try:
                 with open(filename, 'w', encoding='utf-8') as f:
-                    for url, _, _, _, _ in sorted(working, key=lambda x: x[3]):
+                    for url, _, _, _, _ in self._ranked_working():
                         f.write(f"{url}\n")
                 messagebox.showinfo(
                     "成功",
@@ -307,34 +792,49 @@ class GitMirrorTester:
             except Exception as e:
                 messagebox.showerror("错误", f"保存失败: {e}")
 
+    def _mirror_style(self, url):
+        # 未测出引用通告的镜像沿用原先的替换域名写法
+        return (self.refs.get(url) or {}).get('style') or 'host'
+
+    def _insteadof_prefix(self, url):
+        norm = url.rstrip('/')
+        if self._mirror_style(url) == 'prefix':
+            return f"{norm}/https://github.com/"
+        return f"{norm}/"
+
     def copy_config(self):
-        working = [r for r in self.results if r[4]]
+        working = self._ranked_working()
         if not working:
             return
         primary = working[0][0]
         primary_norm = primary.rstrip('/')
+        prefix = self._insteadof_prefix(primary)
         config = (
-            '[url "' + primary_norm + '/"]\n'
+            '[url "' + prefix + '"]\n'
             '    insteadOf = https://github.com/\n'
         )
         try:
             pyperclip.copy(config)
             self.primary_norm = primary_norm
+            self.primary_style = self._mirror_style(primary)
             try:
                 self.copy_proxy_btn.config(state=tk.NORMAL)
             except Exception:
                 pass
-            proxy_concat = f"{primary_norm}/https://github.com/owner/repo.git"
+            if self.primary_style == 'prefix':
+                proxy_concat = f"{primary_norm}/https://github.com/owner/repo.git"
+            else:
+                proxy_concat = f"{primary_norm}/owner/repo.git"
             usage = (
                 "使用说明：\n"
                 "1) 全局设置：\n"
-                f"   git config --global url.\"{primary_norm}/\".insteadOf https://github.com/\n"
+                f"   git config --global url.\"{prefix}\".insteadOf https://github.com/\n"
                 "2) 验证：\n"
                 "   git config --global -l\n"
                 "3) 克隆示例：\n"
                 "   git clone https://github.com/owner/repo.git （将自动走镜像）\n"
                 "4) 取消加速：\n"
-                f"   git config --global --unset-all url.\"{primary_norm}/\".insteadOf\n"
+                f"   git config --global --unset-all url.\"{prefix}\".insteadOf\n"
                 "5) 替换URL方式（无需设置）：\n"
                 f"   git clone {proxy_concat}\n"
                 "提示：若出现 Initial URL is not allowed by proxy rules 错误，请使用上述拼接格式。\n"
@@ -372,13 +872,17 @@ class GitMirrorTester:
                 return
             norm = self._normalize_github_url(url)
             domain = getattr(self, 'primary_norm', '').rstrip('/')
+            style = getattr(self, 'primary_style', 'prefix')
             if not domain:
-                working = [r for r in self.results if r[4]]
+                working = self._ranked_working()
                 if working:
                     domain = working[0][0].rstrip('/')
+                    style = (self.refs.get(working[0][0]) or {}).get('style') or 'prefix'
             if not domain:
                 messagebox.showwarning("提示", "请先进行测试以选择可用镜像源")
                 return
+            if style == 'host' and 'github.com/' in norm:
+                norm = norm.split('github.com/', 1)[1]
             cmd = f"git clone {domain}/{norm}"
             pyperclip.copy(cmd)
             messagebox.showinfo("成功", "代理克隆命令已复制到剪贴板！")
@@ -423,18 +927,17 @@ class GitMirrorTester:
         )
         if filename:
             try:
-                working = [r for r in self.results if r[4]]
+                working = self._ranked_working()
                 with open(filename, 'w', encoding='utf-8') as f:
                     f.write("Git 镜像源测试报告\n")
                     f.write("=" * 60 + "\n\n")
                     f.write(f"测试时间: {time.strftime('%Y-%m-%d %H:%M:%S')}\n\n")
                     f.write(f"✅ 可用镜像源 ({len(working)} 个):\n")
-                    for url, _, _, duration, _ in sorted(working, key=lambda x: x[3]):
-                        f.write(f"   {duration:.3f}s  {url}\n")
+                    for url, _, _, duration, _ in working:
+                        f.write(f"   {duration:.3f}s  {url}  克隆就绪: {self._refs_label(url)}\n")
                     f.write("\n🎯 Git 配置建议（示例，仅供参考）:\n")
                     if working:
-                        primary = working[0][0].rstrip('/')
-                        f.write(f'[url "{primary}/"]\n')
+                        f.write(f'[url "{self._insteadof_prefix(working[0][0])}"]\n')
                         f.write('    insteadOf = https://github.com/\n')
                 messagebox.showinfo("成功", f"完整报告已保存到: {filename}")
             except Exception as e:
@@ -485,7 +988,62 @@ class GitMirrorTester:
             "https://git.yumenaka.net",
             "https://gh.flynp.org",
         }
+        verdicts = self._load_verdicts()
+        lock = threading.Lock()
+        pending = queue.Queue()
         candidates = set()
+        verified = set()
+        checked = [0]
+
+        # 候选地址一出现就进入验证队列，验证与后续搜索页抓取同时进行；
+        # verdict_ttl 内验证过的地址直接沿用上次结论
+        def submit(url):
+            url = self._normalize_url(url)
+            with lock:
+                if not url or url in candidates:
+                    return
+                candidates.add(url)
+                known = verdicts.get(url)
+                if known and time.time() - known[1] < self.verdict_ttl:
+                    if known[0]:
+                        verified.add(url)
+                    return
+            pending.put(url)
+
+        def verifier():
+            while True:
+                url = pending.get()
+                if url is None:
+                    return
+                ok = self._verify_candidate(url, headers)
+                with lock:
+                    verdicts[url] = [ok, time.time()]
+                    if ok:
+                        verified.add(url)
+                    checked[0] += 1
+                    text = f"正在爬取镜像源... 已验证 {checked[0]} 个，可用 {len(verified)} 个"
+                self.root.after(0, lambda text=text: self.status_label.config(text=text))
+
+        # 搜索页由多个线程经同一连接池并发抓取，提取到的链接直接送入验证队列
+        pattern = re.compile(r'href=["\'](https?://[^"\'<>\s]+)["\']')
+        session = self._search_session(self.search_workers)
+        pages = queue.Queue()
+        for url in search_pages:
+            pages.put(url)
+
+        def fetcher():
+            while True:
+                try:
+                    url = pages.get_nowait()
+                except queue.Empty:
+                    return
+                for link in self._search_links(session, url, pattern):
+                    if self._looks_like_mirror(link):
+                        submit(link)
+
+        workers = [threading.Thread(target=verifier, daemon=True) for _ in range(self.verify_workers)]
+        for worker in workers:
+            worker.start()
         try:
             if os.path.exists(self.default_file):
                 try:
@@ -493,32 +1051,24 @@ class GitMirrorTester:
                         for line in f:
                             line = line.strip()
                             if line:
-                                candidates.add(self._normalize_url(line))
-                except Exception:
-                    pass
-
-            for url in search_pages:
-                try:
-                    r = requests.get(url, headers=headers, timeout=self.timeout)
-                    links = re.findall(r'href=["\'](https?://[^"\'<>\s]+)["\']', r.text)
-                    for link in links:
-                        if self._looks_like_mirror(link):
-                            candidates.add(self._normalize_url(link))
+                                submit(line)
                 except Exception:
                     pass
 
             for u in seed_candidates:
-                candidates.add(self._normalize_url(u))
+                submit(u)
 
-            verified = set()
-            for u in candidates:
-                try:
-                    resp = requests.head(u, headers=headers, timeout=5, allow_redirects=True)
-                    if resp.status_code is None or resp.status_code >= 500:
-                        continue
-                    verified.add(u)
-                except Exception:
-                    continue
+            fetchers = [threading.Thread(target=fetcher, daemon=True) for _ in range(self.search_workers)]
+            for thread in fetchers:
+                thread.start()
+            for thread in fetchers:
+                thread.join()
+
+            for _ in workers:
+                pending.put(None)
+            for worker in workers:
+                worker.join()
+            self._save_verdicts()
 
             final = sorted(verified if verified else candidates)
             if final:
@@ -530,6 +1080,8 @@ class GitMirrorTester:
             else:
                 self.root.after(0, lambda: messagebox.showwarning("提示", "未获取到镜像源，请稍后重试"))
         finally:
+            session.close()
+
             def reset():
                 try:
                     self.crawl_btn.config(text="🕸️ 一键爬取像源", state=tk.NORMAL)
@@ -541,6 +1093,50 @@ class GitMirrorTester:
                 self.clear_btn.config(state=tk.NORMAL)
             self.root.after(0, reset)
 
+    def _verify_candidate(self, url, headers):
+        try:
+            resp = requests.head(url, headers=headers, timeout=5, allow_redirects=True)
+        except Exception:
+            return False
+        return resp.status_code is not None and resp.status_code < 500
+
+    def _load_verdicts(self):
+        # 候选地址验证结论：{地址: [是否可用, 验证时间]}，持久化在 crawl_verdicts.json
+        if self.verdicts is None:
+            try:
+                with open(self.verdict_file, 'r', encoding='utf-8') as f:
+                    self.verdicts = json.load(f)
+            except (OSError, ValueError):
+                self.verdicts = {}
+        return self.verdicts
+
+    def _save_verdicts(self):
+        # 写入前丢弃超过 verdict_ttl 的结论，文件不会随爬取次数无限增长
+        now = time.time()
+        self.verdicts = {url: v for url, v in (self.verdicts or {}).items() if now - v[1] < self.verdict_ttl}
+        try:
+            with open(self.verdict_file, 'w', encoding='utf-8') as f:
+                json.dump(self.verdicts, f, ensure_ascii=False)
+        except OSError:
+            pass
+
+    def _load_latency_history(self):
+        # 各镜像最近 history_size 次成功探测的耗时：{地址: [耗时, ...]}，持久化在 latency_history.json
+        if self.latency_history is None:
+            try:
+                with open(self.latency_file, 'r', encoding='utf-8') as f:
+                    self.latency_history = json.load(f)
+            except (OSError, ValueError):
+                self.latency_history = {}
+        return self.latency_history
+
+    def _save_latency_history(self):
+        try:
+            with open(self.latency_file, 'w', encoding='utf-8') as f:
+                json.dump(self.latency_history or {}, f, ensure_ascii=False)
+        except OSError:
+            pass
+
     def _normalize_url(self, url):
         url = url.strip().strip('`').strip().rstrip('/')
         if not url:
@@ -583,10 +1179,305 @@ class GitMirrorTester:
         except Exception:
             return os.getcwd()
 
+class _GitCacheHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        self.server.cache.handle(self)
+
+    do_POST = do_GET
+
+
+class GitCacheServer:
+    # 本地 Git 缓存服务：repos 中的每个 GitHub 仓库在 cache_dir 下保存一份裸仓库（owner/repo.git），
+    # 后台每隔 refresh_interval 经排名最前的镜像增量 fetch 分支与标签，失败时依次换用后续镜像；
+    # 本地经 git http-backend 以 smart HTTP 提供，不在列表中或尚未同步完成的仓库重定向到最快的镜像。
+    def __init__(self, tester, repos, port=8418, cache_dir=None, refresh_interval=300, fetch_timeout=3600):
+        self.tester = tester
+        self.port = port
+        self.cache_dir = cache_dir or os.path.join(tester.app_dir, "git_cache")
+        self.refresh_interval = refresh_interval
+        self.fetch_timeout = fetch_timeout
+        self.repos = {}
+        for repo in repos:
+            url = tester._normalize_github_url(repo)
+            if 'github.com/' in url:
+                key = url.split('github.com/', 1)[1]
+                self.repos[key.lower()] = key
+        self.upstreams = []
+        self.ready = set()
+        self.lock = threading.Lock()
+        self.stop_event = threading.Event()
+        self.server = None
+        self.stats = {'requests': 0, 'hits': 0, 'redirects': 0, 'fetches': 0, 'errors': 0}
+
+    def start(self, upstreams):
+        if not shutil.which('git'):
+            raise RuntimeError("未找到 git 命令")
+        self.set_upstreams(upstreams)
+        os.makedirs(self.cache_dir, exist_ok=True)
+        for key in self.repos.values():
+            if self._has_refs(key):
+                self.ready.add(key)
+        self.server = http.server.ThreadingHTTPServer(('127.0.0.1', self.port), _GitCacheHandler)
+        self.server.daemon_threads = True
+        self.server.cache = self
+        self.stop_event.clear()
+        for target in (self.server.serve_forever, self._refresh_loop):
+            t = threading.Thread(target=target)
+            t.daemon = True
+            t.start()
+
+    def set_upstreams(self, upstreams):
+        with self.lock:
+            self.upstreams = list(upstreams)
+
+    def stop(self):
+        self.stop_event.set()
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+
+    def _repo_dir(self, key):
+        return os.path.join(self.cache_dir, *key.split('/'))
+
+    def _has_refs(self, key):
+        path = self._repo_dir(key)
+        if not os.path.isdir(path):
+            return False
+        result = self._git('--git-dir', path, 'for-each-ref', '--count=1', 'refs/heads/', timeout=60)
+        return result.returncode == 0 and bool(result.stdout.strip())
+
+    def _git(self, *args, timeout=None):
+        return subprocess.run(['git', *args], capture_output=True, text=True, timeout=timeout or self.fetch_timeout)
+
+    def _refresh_loop(self):
+        while not self.stop_event.is_set():
+            for key in list(self.repos.values()):
+                if self.stop_event.is_set():
+                    return
+                self.sync(key)
+            self.stop_event.wait(self.refresh_interval)
+
+    def sync(self, key):
+        # 新仓库先 init --bare，首次同步成功后按上游 HEAD 设置默认分支；之后每次 fetch 只传输增量对象
+        path = self._repo_dir(key)
+        created = not self._has_refs(key)
+        if not os.path.isdir(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            self._git('init', '--bare', '-q', path)
+        with self.lock:
+            upstreams = list(self.upstreams)
+        error = "没有可用的上游镜像"
+        for mirror, style in upstreams:
+            url = self.tester._refs_url(mirror, style, f"https://github.com/{key}")
+            start = time.perf_counter()
+            try:
+                result = self._git('--git-dir', path, '-c', 'http.lowSpeedLimit=1000', '-c', 'http.lowSpeedTime=30',
+                                   'fetch', '--prune', '--quiet', url,
+                                   '+refs/heads/*:refs/heads/*', '+refs/tags/*:refs/tags/*')
+            except subprocess.TimeoutExpired:
+                error = f"{mirror}: 超时"
+                continue
+            if result.returncode != 0:
+                error = f"{mirror}: {result.stderr.strip().splitlines()[-1] if result.stderr.strip() else result.returncode}"
+                continue
+            if created:
+                try:
+                    head = self._git('ls-remote', '--symref', url, 'HEAD', timeout=60)
+                except subprocess.TimeoutExpired:
+                    head = None
+                match = head and re.match(r'ref: (refs/heads/\S+)\s+HEAD', head.stdout)
+                if match:
+                    self._git('--git-dir', path, 'symbolic-ref', 'HEAD', match.group(1))
+            with self.lock:
+                self.ready.add(key)
+                self.stats['fetches'] += 1
+            self.tester._post(self.tester.update_sync, key, {'ok': True, 'upstream': mirror, 'seconds': time.perf_counter() - start})
+            return True
+        with self.lock:
+            self.stats['errors'] += 1
+        self.tester._post(self.tester.update_sync, key, {'ok': False, 'error': error})
+        return False
+
+    def handle(self, handler):
+        with self.lock:
+            self.stats['requests'] += 1
+        path, _, query = handler.path.partition('?')
+        match = re.match(r'^/([^/]+)/([^/]+?)(?:\.git)?/(info/refs|git-upload-pack|git-receive-pack|HEAD|objects/.+)$', path)
+        if not match:
+            self._reply(handler, 404, b"not found\n")
+            return
+        owner, name, rest = match.groups()
+        if rest == 'git-receive-pack' or 'git-receive-pack' in query:
+            self._reply(handler, 403, b"read-only cache\n")
+            return
+        key = self.repos.get(f"{owner}/{name}.git".lower())
+        with self.lock:
+            cached = key in self.ready
+            upstream = self.upstreams[0] if self.upstreams else None
+        if not cached:
+            if upstream is None:
+                self._reply(handler, 502, b"no upstream mirror\n")
+                return
+            # git 只在首个 info/refs 请求上跟随重定向，之后的 upload-pack 请求直接发往镜像
+            target = self.tester._refs_url(upstream[0], upstream[1], f"https://github.com/{owner}/{name}.git")
+            handler.send_response(302)
+            handler.send_header('Location', f"{target}/{rest}" + (f"?{query}" if query else ""))
+            handler.send_header('Content-Length', '0')
+            handler.end_headers()
+            with self.lock:
+                self.stats['redirects'] += 1
+            return
+        with self.lock:
+            self.stats['hits'] += 1
+        self._backend(handler, f"/{key}/{rest}", query)
+
+    def _read_body(self, handler):
+        if handler.headers.get('Transfer-Encoding', '').lower() == 'chunked':
+            body = b""
+            while True:
+                size = int(handler.rfile.readline().split(b";")[0].strip() or b"0", 16)
+                if size == 0:
+                    handler.rfile.readline()
+                    return body
+                body += handler.rfile.read(size)
+                handler.rfile.readline()
+        length = int(handler.headers.get('Content-Length') or 0)
+        return handler.rfile.read(length) if length else b""
+
+    def _backend(self, handler, path_info, query):
+        # 以 CGI 方式调用 git http-backend，边生成边转发：带 Content-Length 的响应（HEAD、objects/...
+        # 等静态文件）原样转发，其余按 chunked 编码转发
+        body = self._read_body(handler)
+        env = dict(os.environ, GIT_PROJECT_ROOT=self.cache_dir, GIT_HTTP_EXPORT_ALL='1',
+                   PATH_INFO=path_info, QUERY_STRING=query, REQUEST_METHOD=handler.command,
+                   CONTENT_TYPE=handler.headers.get('Content-Type', ''), CONTENT_LENGTH=str(len(body)),
+                   REMOTE_ADDR=handler.client_address[0])
+        if handler.headers.get('Git-Protocol'):
+            env['GIT_PROTOCOL'] = handler.headers['Git-Protocol']
+        if handler.headers.get('Content-Encoding'):
+            env['HTTP_CONTENT_ENCODING'] = handler.headers['Content-Encoding']
+        proc = subprocess.Popen(['git', 'http-backend'], stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                                stderr=subprocess.DEVNULL, env=env)
+
+        def feed():
+            try:
+                proc.stdin.write(body)
+            except OSError:
+                pass
+            finally:
+                proc.stdin.close()
+
+        threading.Thread(target=feed, daemon=True).start()
+        try:
+            status = 200
+            headers = []
+            while True:
+                line = proc.stdout.readline().decode('latin-1').rstrip('\r\n')
+                if not line:
+                    break
+                name, _, value = line.partition(':')
+                if name.lower() == 'status':
+                    status = int(value.split()[0])
+                else:
+                    headers.append((name, value.strip()))
+            chunked = not any(name.lower() == 'content-length' for name, _ in headers)
+            handler.send_response(status)
+            for name, value in headers:
+                handler.send_header(name, value)
+            if chunked:
+                handler.send_header('Transfer-Encoding', 'chunked')
+            handler.end_headers()
+            while True:
+                chunk = proc.stdout.read1(65536)
+                if not chunk:
+                    break
+                if chunked:
+                    chunk = f"{len(chunk):x}\r\n".encode() + chunk + b"\r\n"
+                handler.wfile.write(chunk)
+            if chunked:
+                handler.wfile.write(b"0\r\n\r\n")
+        except OSError:
+            handler.close_connection = True
+        finally:
+            proc.stdout.close()
+            proc.wait()
+
+    def _reply(self, handler, status, body):
+        handler.send_response(status)
+        handler.send_header('Content-Type', 'text/plain')
+        handler.send_header('Content-Length', str(len(body)))
+        handler.end_headers()
+        handler.wfile.write(body)
+
 def main():
-    root = tk.Tk()
-    app = GitMirrorTester(root)
-    root.mainloop()
+    parser = argparse.ArgumentParser(description="Git 镜像源测试工具")
+    parser.add_argument("--headless", action="store_true", help="不启动界面，结果以 JSON Lines 输出到标准输出")
+    parser.add_argument("-i", "--input", help="镜像源列表文件，'-' 表示从标准输入读取（默认 mirrors.txt）")
+    parser.add_argument("--timeout", type=float, help="单个请求超时（秒）")
+    parser.add_argument("--ref-repo", help="用于探测 info/refs 的参考仓库（默认 octocat/Hello-World）")
+    parser.add_argument("--pack", action="store_true", help="测试完成后对可用源执行 upload-pack 克隆测速")
+    parser.add_argument("--pack-repo", help="克隆测速使用的仓库（默认 psf/requests）")
+    parser.add_argument("--serve", type=int, metavar="PORT", help="检测完成后在 127.0.0.1:PORT 启动本地 Git 缓存服务（需配合 --headless）")
+    parser.add_argument("--repos", help="本地缓存的仓库列表文件，每行一个 GitHub 仓库（默认 cache_repos.txt）")
+    args = parser.parse_args()
+
+    if not args.headless:
+        if tk is None:
+            parser.error("当前环境缺少 tkinter，请使用 --headless")
+        root = tk.Tk()
+        app = GitMirrorTester(root)
+        root.mainloop()
+        return
+
+    app = GitMirrorTester()
+    if args.timeout:
+        app.timeout = args.timeout
+    if args.ref_repo:
+        app.ref_repo = args.ref_repo
+    if args.pack_repo:
+        app.pack_repo = args.pack_repo
+    if args.input == '-':
+        content = sys.stdin.read()
+    else:
+        path = args.input or app.default_file
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                content = f.read()
+        except OSError as e:
+            parser.error(f"无法读取镜像源列表 {path}: {e.strerror or e}")
+    mirrors = app._parse_mirrors(content)
+    if not mirrors:
+        parser.error("未找到有效的镜像源")
+    working = app.run_headless(mirrors)
+    if args.pack and working:
+        app.pack_benchmark([r[0] for r in app._ranked_working()])
+    if args.serve and working:
+        upstreams = app.cache_upstreams()
+        if not upstreams:
+            parser.error("没有能返回引用通告的镜像源，无法启动本地缓存服务")
+        try:
+            repos = app.load_cache_repos(args.repos)
+        except OSError as e:
+            parser.error(f"无法读取仓库列表: {e}")
+        server = GitCacheServer(app, repos, port=args.serve, cache_dir=app.cache_dir)
+        try:
+            server.start(upstreams)
+        except (OSError, RuntimeError) as e:
+            parser.error(f"无法启动本地缓存服务: {getattr(e, 'strerror', None) or e}")
+        app._emit({'type': 'serve', 'listen': f"http://127.0.0.1:{args.serve}", 'repos': sorted(server.repos.values()),
+                   'upstreams': [mirror for mirror, _ in upstreams]})
+        try:
+            while True:
+                time.sleep(3600)
+        except KeyboardInterrupt:
+            server.stop()
+    sys.exit(0 if working else 1)
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,293 @@
+"""Docker-testing.py 与 Git-testing.py 共用的 HTTP 探测与搜索页抓取"""
+import codecs
+import hashlib
+import http.client
+import json
+import os
+import queue
+import socket
+import ssl
+import threading
+import time
+from urllib.parse import urlparse, urljoin
+
+import requests
+
+
+class MirrorProbeMixin:
+    # 使用方需提供：timeout、user_agent、_ssl_context（初始为 None），
+    # 以及搜索页缓存用的 search_cache_dir、search_cache_ttl、search_max_bytes
+    search_cache_keep = 4
+
+    def _hedged_probe(self, url, timeout, hedge_after):
+        """在 timeout 内分阶段探测一次，超过 hedge_after 仍未返回时用新连接再发一次
+
+        取先成功的结果，两次都失败才算失败；两次尝试共用同一个截止时间，对冲成功时耗时按首次发出到
+        拿到结果计算。返回 (是否成功, (状态码, 分阶段耗时) 或异常, 耗时)；截止时仍未返回时第二项为 None。
+        """
+        start = time.perf_counter()
+        deadline = start + timeout
+        outcomes = queue.Queue()
+
+        def attempt(limit):
+            try:
+                outcomes.put((True, self._phase_probe(url, limit)))
+            except Exception as e:
+                outcomes.put((False, e))
+
+        def wait():
+            return outcomes.get(timeout=max(0.0, deadline - time.perf_counter()))
+
+        threading.Thread(target=attempt, args=(timeout,), daemon=True).start()
+        attempts = 1
+        try:
+            try:
+                ok, value = outcomes.get(timeout=hedge_after)
+            except queue.Empty:
+                threading.Thread(target=attempt, args=(timeout - hedge_after,), daemon=True).start()
+                attempts = 2
+                ok, value = wait()
+            if not ok and attempts == 2:
+                ok, value = wait()
+        except queue.Empty:
+            return False, None, time.perf_counter() - start
+        if not ok:
+            return False, value, time.perf_counter() - start
+        phases = value[1]
+        phases['timeout'] = timeout
+        phases['hedged'] = attempts == 2
+        return True, value, phases['total'] if attempts == 1 else time.perf_counter() - start
+
+    def _timed_out(self, value):
+        return value is None or isinstance(value, (socket.timeout, requests.Timeout))
+
+    def _open_connection(self, parts, timeout=None):
+        """建立新连接并分别计时 DNS 解析、TCP 建连、TLS 握手
+
+        依次尝试解析到的每个地址，TCP 耗时包含失败的尝试。
+        """
+        timeout = timeout or self.timeout
+        https = parts.scheme == 'https'
+        host = parts.hostname
+        port = parts.port or (443 if https else 80)
+        t0 = time.perf_counter()
+        infos = socket.getaddrinfo(host, port, type=socket.SOCK_STREAM)
+        t1 = time.perf_counter()
+        sock, error = None, None
+        for family, socktype, proto, _, sockaddr in infos:
+            sock = socket.socket(family, socktype, proto)
+            sock.settimeout(timeout)
+            try:
+                sock.connect(sockaddr)
+                break
+            except OSError as e:
+                sock.close()
+                sock, error = None, e
+        if sock is None:
+            raise error
+        t2 = time.perf_counter()
+        try:
+            if https:
+                sock = self._tls_context().wrap_socket(sock, server_hostname=host)
+            t3 = time.perf_counter()
+        except Exception:
+            sock.close()
+            raise
+        if https:
+            conn = http.client.HTTPSConnection(host, port, timeout=timeout)
+        else:
+            conn = http.client.HTTPConnection(host, port, timeout=timeout)
+        conn.sock = sock
+        timing = {'dns': t1 - t0, 'tcp': t2 - t1, 'tls': t3 - t2}
+        return conn, (parts.scheme, host, port), timing
+
+    def _tls_context(self):
+        """与 requests 使用相同的 CA 证书：REQUESTS_CA_BUNDLE / CURL_CA_BUNDLE，否则为 certifi"""
+        if self._ssl_context is None:
+            cafile = os.environ.get('REQUESTS_CA_BUNDLE') or os.environ.get('CURL_CA_BUNDLE') or requests.certs.where()
+            self._ssl_context = ssl.create_default_context(cafile=cafile)
+        return self._ssl_context
+
+    def _proxy_for(self, url):
+        """按 HTTP(S)_PROXY / NO_PROXY 环境变量取该地址要走的代理，不走代理时返回 None"""
+        return requests.utils.select_proxy(url, requests.utils.get_environ_proxies(url))
+
+    def _proxy_probe(self, url, proxy, timeout=None):
+        """经代理时无法单独计时 DNS/TCP/TLS，改用 requests 计时首字节、重定向与同一会话的热请求"""
+        timeout = timeout or self.timeout
+        headers = {'User-Agent': self.user_agent}
+        phases = {'dns': None, 'tcp': None, 'tls': None, 'ttfb': 0.0, 'redirect': 0.0, 'total': 0.0, 'warm': None, 'hops': 0, 'proxy': proxy}
+        start = time.perf_counter()
+        with requests.Session() as session:
+            response = session.head(url, headers=headers, timeout=timeout, allow_redirects=True)
+            phases['total'] = time.perf_counter() - start
+            phases['hops'] = min(len(response.history), 5)
+            phases['ttfb'] = (response.history[0] if response.history else response).elapsed.total_seconds()
+            if response.history:
+                phases['redirect'] = max(0.0, phases['total'] - phases['ttfb'])
+            try:
+                phases['warm'] = session.head(response.url, headers=headers, timeout=timeout, allow_redirects=False).elapsed.total_seconds()
+            except requests.RequestException:
+                phases['warm'] = None
+        return response.status_code, phases
+
+    def _head(self, conn, parts):
+        """在已有连接上发送 HEAD，返回 (响应, 耗时)"""
+        path = parts.path or '/'
+        if parts.query:
+            path += '?' + parts.query
+        t = time.perf_counter()
+        conn.request('HEAD', path, headers={'User-Agent': self.user_agent, 'Connection': 'keep-alive'})
+        response = conn.getresponse()
+        response.read()
+        return response, time.perf_counter() - t
+
+    def _phase_probe(self, url, timeout=None):
+        """分阶段探测：冷启动的 DNS/TCP/TLS/首字节/重定向耗时，以及复用同一连接的热请求耗时
+
+        热请求只包含一次网络往返加服务端处理时间，与 TCP 建连耗时（约一次往返）对比
+        即可判断慢在链路还是慢在后端。配置了代理时改用 _proxy_probe，各阶段为 None。
+        """
+        proxy = self._proxy_for(url)
+        if proxy:
+            return self._proxy_probe(url, proxy, timeout)
+        phases = {'dns': 0.0, 'tcp': 0.0, 'tls': 0.0, 'ttfb': 0.0, 'redirect': 0.0, 'total': 0.0, 'warm': None, 'hops': 0}
+        start = time.perf_counter()
+        conn, conn_key, timing = None, None, None
+        current = url
+        try:
+            while True:
+                parts = urlparse(current)
+                key = (parts.scheme, parts.hostname, parts.port or (443 if parts.scheme == 'https' else 80))
+                if conn is None or key != conn_key:
+                    if conn is not None:
+                        conn.close()
+                    conn, conn_key, timing = self._open_connection(parts, timeout)
+                    if phases['hops'] == 0:
+                        phases.update(timing)
+                response, elapsed = self._head(conn, parts)
+                if phases['hops'] == 0:
+                    phases['ttfb'] = elapsed
+                location = response.getheader('Location')
+                if response.status in (301, 302, 303, 307, 308) and location and phases['hops'] < 5:
+                    current = urljoin(current, location)
+                    phases['hops'] += 1
+                    continue
+                break
+            phases['total'] = time.perf_counter() - start
+            phases['redirect'] = max(0.0, phases['total'] - phases['dns'] - phases['tcp'] - phases['tls'] - phases['ttfb'])
+            # 服务端未保持连接时 http.client 会清空 sock，此时无法得到复用数据
+            if conn.sock is not None:
+                try:
+                    _, phases['warm'] = self._head(conn, parts)
+                except Exception:
+                    phases['warm'] = None
+            return response.status, phases
+        finally:
+            if conn is not None:
+                conn.close()
+
+    def _diagnose(self, phases):
+        """以 TCP 建连近似一次往返：热请求中扣除往返后的部分视为后端处理耗时"""
+        if phases.get('warm') is None or phases.get('tcp') is None:
+            return None
+        rtt = phases['tcp']
+        backend = max(0.0, phases['warm'] - rtt)
+        return 'backend' if backend > rtt else 'network'
+
+    def _search_session(self, pool_size):
+        """搜索页共用的连接池会话"""
+        session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=4, pool_maxsize=pool_size)
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        session.headers['User-Agent'] = self.user_agent
+        return session
+
+    def _search_links(self, session, url, pattern):
+        """抓取搜索结果页并提取链接，结果缓存在 search_cache 目录
+
+        search_cache_ttl 内直接使用缓存；过期后带 ETag/Last-Modified 做条件请求，304 时沿用缓存的链接。
+        出错或返回其他状态码（如限流时的 202/403）时沿用过期的缓存，没有缓存时返回空列表。
+        """
+        path = os.path.join(self.search_cache_dir, hashlib.sha1(url.encode()).hexdigest() + ".json")
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                cached = json.load(f)
+        except (OSError, ValueError):
+            cached = None
+        if cached and time.time() - cached['fetched'] < self.search_cache_ttl:
+            return cached['links']
+        headers = {}
+        if cached and cached.get('etag'):
+            headers['If-None-Match'] = cached['etag']
+        if cached and cached.get('last_modified'):
+            headers['If-Modified-Since'] = cached['last_modified']
+        try:
+            with session.get(url, headers=headers, timeout=self.timeout, stream=True) as r:
+                if r.status_code == 304 and cached:
+                    entry = dict(cached, fetched=time.time())
+                elif r.status_code == 200:
+                    entry = {'url': url, 'fetched': time.time(), 'etag': r.headers.get('ETag'),
+                             'last_modified': r.headers.get('Last-Modified'), 'links': self._scan_links(r, pattern)}
+                else:
+                    return cached['links'] if cached else []
+        except Exception:
+            return cached['links'] if cached else []
+        try:
+            os.makedirs(self.search_cache_dir, exist_ok=True)
+            tmp = f"{path}.{threading.get_ident()}.tmp"
+            with open(tmp, 'w', encoding='utf-8') as f:
+                json.dump(entry, f, ensure_ascii=False)
+            os.replace(tmp, path)
+        except OSError:
+            pass
+        self._prune_search_cache()
+        return entry['links']
+
+    def _prune_search_cache(self):
+        """删除超过 search_cache_keep 个 TTL 未更新的搜索页缓存"""
+        cutoff = time.time() - self.search_cache_ttl * self.search_cache_keep
+        try:
+            names = os.listdir(self.search_cache_dir)
+        except OSError:
+            return
+        for name in names:
+            path = os.path.join(self.search_cache_dir, name)
+            try:
+                if os.path.getmtime(path) < cutoff:
+                    os.remove(path)
+            except OSError:
+                pass
+
+    def _scan_links(self, response, pattern):
+        """边读响应边提取链接，最多读取 search_max_bytes 字节
+
+        每块末尾保留一段未确定的文本与下一块拼接，避免链接被块边界截断。
+        """
+        links = []
+        seen = set()
+        decoder = codecs.getincrementaldecoder(response.encoding or 'utf-8')(errors='ignore')
+
+        def scan(text, final):
+            limit = len(text) if final else max(0, len(text) - 512)
+            cut = limit
+            for m in pattern.finditer(text):
+                if m.end() > limit:
+                    cut = min(cut, m.start())
+                    break
+                link = m.group(m.lastindex or 0)
+                if link not in seen:
+                    seen.add(link)
+                    links.append(link)
+            return text[cut:]
+
+        carry = ""
+        received = 0
+        for chunk in response.iter_content(16384):
+            received += len(chunk)
+            carry = scan(carry + decoder.decode(chunk), False)
+            if received >= self.search_max_bytes:
+                break
+        scan(carry + decoder.decode(b"", True), True)
+        return links